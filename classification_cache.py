@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import CLASSIFICATION_CACHE_SIZE, CLASSIFICATION_SIMHASH_DISTANCE
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Bodies shorter than this many words are too small for SimHash to be meaningful
+SIMHASH_MIN_WORDS = 8
+
+# Log hit-rate stats every this many lookups
+STATS_LOG_INTERVAL = 100
+
+_WORD_RE = re.compile(r"\w+")
+
+def normalize_for_key(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+def body_fingerprint(text: str) -> str:
+    return hashlib.sha256(normalize_for_key(text).encode("utf-8")).hexdigest()
+
+def simhash(text: str) -> int | None:
+    """
+    64-bit SimHash over word bigrams, or None for very short bodies.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SIMHASH_MIN_WORDS:
+        return None
+    weights = [0] * 64
+    for i in range(len(words) - 1):
+        h = int.from_bytes(hashlib.blake2b(" ".join(words[i:i + 2]).encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+class ClassificationCache:
+    """
+    Caches classifier output by body fingerprint: an in-memory LRU in front
+    of a SQLite table that survives restarts. When `max_distance` > 0,
+    bodies whose SimHash is within that many bits of a cached one can reuse
+    its result too; `get` reports such near hits so callers can decide how
+    much of the result still applies.
+    Entries are tagged with `prompt_version`; anything cached under a
+    different prompt is discarded when the cache is first used.
+    """
+
+    def __init__(self, prompt_version: str, max_entries: int = CLASSIFICATION_CACHE_SIZE,
+                 max_distance: int = CLASSIFICATION_SIMHASH_DISTANCE):
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries: OrderedDict[str, tuple[str, int | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.stats = {"memory_hits": 0, "store_hits": 0, "near_hits": 0, "misses": 0}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        conn = get_connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS classification_cache ("
+            " key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, value TEXT NOT NULL,"
+            " simhash INTEGER, updated_at REAL NOT NULL)"
+        )
+        removed = conn.execute(
+            "DELETE FROM classification_cache WHERE prompt_version != ?", (self.prompt_version,)
+        ).rowcount
+        if removed:
+            logger.info("Dropped %d cached classifications from an older prompt", removed)
+        rows = conn.execute(
+            "SELECT key, value, simhash FROM classification_cache ORDER BY updated_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for key, value, sh in reversed(rows):
+            self._entries[key] = (value, _to_unsigned(sh) if sh is not None else None)
+        self._loaded = True
+
+    def _remember(self, key: str, value: str, sh: int | None):
+        self._entries[key] = (value, sh)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _record(self, outcome: str):
+        self.stats[outcome] += 1
+        lookups = sum(self.stats.values())
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logger.info("Classification cache: %s, hit rate %.1f%%",
+                        self.stats, 100.0 * (lookups - self.stats["misses"]) / lookups)
+
+    def get(self, text: str) -> tuple[str | None, bool]:
+        """
+        Return (cached value or None, whether it came from a near hit).
+        """
+        key = body_fingerprint(text)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                self._record("memory_hits")
+                return entry[0], False
+
+            row = get_connection().execute(
+                "SELECT value, simhash FROM classification_cache WHERE key = ? AND prompt_version = ?",
+                (key, self.prompt_version),
+            ).fetchone()
+            if row:
+                self._remember(key, row[0], _to_unsigned(row[1]) if row[1] is not None else None)
+                self._record("store_hits")
+                return row[0], False
+
+            if self.max_distance > 0:
+                sh = simhash(text)
+                if sh is not None:
+                    for value, other in reversed(self._entries.values()):
+                        if other is not None and bin(sh ^ other).count("1") <= self.max_distance:
+                            self._record("near_hits")
+                            return value, True
+
+            self._record("misses")
+            return None, False
+
+    def put(self, text: str, value: str):
+        key = body_fingerprint(text)
+        sh = simhash(text) if self.max_distance > 0 else None
+        with self._lock:
+            self._ensure_loaded()
+            self._remember(key, value, sh)
+            get_connection().execute(
+                "INSERT OR REPLACE INTO classification_cache (key, prompt_version, value, simhash, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, self.prompt_version, value, _to_signed(sh) if sh is not None else None, time.time()),
+            )
+
+    def invalidate(self):
+        """
+        Forget every cached result, in memory and on disk.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self._entries.clear()
+            get_connection().execute("DELETE FROM classification_cache")
@@ -10,4 +10,67 @@ CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 TENANT_ID = os.getenv("TENANT_ID")
 GRAPH_SCOPE = ["https://graph.microsoft.com/.default"]
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Notification ingestion
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "500"))
+NOTIFICATION_SHUTDOWN_TIMEOUT = float(os.getenv("NOTIFICATION_SHUTDOWN_TIMEOUT", "30"))
+
+# Graph HTTP session
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", str(max(10, NOTIFICATION_WORKERS * 2))))
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "30"))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "4"))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", "0.5"))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", "60"))
+GRAPH_CIRCUIT_THRESHOLD = int(os.getenv("GRAPH_CIRCUIT_THRESHOLD", "5"))
+GRAPH_CIRCUIT_COOLDOWN = float(os.getenv("GRAPH_CIRCUIT_COOLDOWN", "30"))
+FOLDER_CACHE_TTL = float(os.getenv("FOLDER_CACHE_TTL", str(6 * 60 * 60)))
+
+# Master list lookups
+MASTER_LIST_VERSION_CHECK_INTERVAL = float(os.getenv("MASTER_LIST_VERSION_CHECK_INTERVAL", "60"))
+
+# Graph JSON batching: requests queue up only while this many calls are in flight
+GRAPH_BATCH_ENABLED = os.getenv("GRAPH_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+GRAPH_BATCH_SENDERS = int(os.getenv("GRAPH_BATCH_SENDERS", "2"))
+
+# Email body normalization
+EMAIL_BODY_TOKEN_BUDGET = int(os.getenv("EMAIL_BODY_TOKEN_BUDGET", "800"))
+
+# Local state (SQLite) shared by the caches and stores in this process group
+LOCAL_STATE_DIR = os.getenv("LOCAL_STATE_DIR", "local_state")
+
+# Classification cache
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "10000"))
+CLASSIFICATION_SIMHASH_DISTANCE = int(os.getenv("CLASSIFICATION_SIMHASH_DISTANCE", "3"))
+
+# Batched classification (a batch size of 1 disables batching); emails only
+# queue up while CLASSIFICATION_BATCH_SENDERS requests are in flight
+CLASSIFICATION_BATCH_SIZE = int(os.getenv("CLASSIFICATION_BATCH_SIZE", "10"))
+CLASSIFICATION_BATCH_SENDERS = int(os.getenv("CLASSIFICATION_BATCH_SENDERS", "1"))
+
+# OpenAI gateway limits
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# Message dedup
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", str(7 * 24 * 60 * 60)))
+DEDUP_MEMORY_SIZE = int(os.getenv("DEDUP_MEMORY_SIZE", "50000"))
+
+# Graph subscriptions
+SUBSCRIPTION_RENEW_BEFORE = float(os.getenv("SUBSCRIPTION_RENEW_BEFORE", str(12 * 60 * 60)))
+SUBSCRIPTION_LIFETIME = float(os.getenv("SUBSCRIPTION_LIFETIME", str(2 * 24 * 60 * 60)))
+SUBSCRIPTION_CHECK_INTERVAL = float(os.getenv("SUBSCRIPTION_CHECK_INTERVAL", "300"))
+
+# Delta catch-up
+DELTA_SYNC_INTERVAL = float(os.getenv("DELTA_SYNC_INTERVAL", "900"))
+DELTA_SYNC_GRACE = float(os.getenv("DELTA_SYNC_GRACE", "3600"))
+
+# Master list recompiles
+RECOMPILE_WORKERS = int(os.getenv("RECOMPILE_WORKERS", "4"))
+RECOMPILE_DEBOUNCE = float(os.getenv("RECOMPILE_DEBOUNCE", "10"))
+
+# list_files rows (with their file_data) fetched per Supabase request
+FILE_FETCH_PAGE_SIZE = int(os.getenv("FILE_FETCH_PAGE_SIZE", "25"))
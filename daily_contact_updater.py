@@ -1,148 +1,148 @@
 import csv
 import io
 import logging
-from supabase_client import supabase, decode_file_data_hex, update_file_data
+from supabase_client import (
+    supabase,
+    update_file_data,
+    fetch_file_records,
+    fetch_files_created_by,
+    get_user_emails_for_files
+)
+from file_codec import open_file_data
 # from config import SUPABASE_URL, SUPABASE_KEY
-from recipient_list_loader import compile_and_store_master_list
+from recipient_list_loader import find_email_key, find_name_key
+from recompile_scheduler import master_list_recompiler
 
 logger = logging.getLogger(__name__)
 
-def find_email_key(headers: list[str]) -> str | None:
-    for h in headers:
-        if h.lower() in ('email', 'email id'):
-            return h
-    return None
-
-def find_name_key(headers: list[str]) -> str | None:
-    for h in headers:
-        if h.lower() in ('name', 'contact name'):
-            return h
-    return None
-
-def update_affected_users(file_id: str):
-    links = supabase.table("company_recipient_lists").select("user_id").eq("file_id", file_id).execute().data
-    for link in links:
-        user_id = link["user_id"]
-        user = supabase.table("users").select("email").eq("id", user_id).single().execute().data
-        if user:
-            try:
-                compile_and_store_master_list(user["email"])
-                logger.info(f"Updated master list for affected user {user['email']}")
-                print(f"Updated master list for affected user {user['email']}")
-            except Exception as e:
-                logger.error(f"Failed to update master list for {user['email']}: {e}")
-                print(f"Failed to master list for affected user {user['email']}")
-
-def process_unsubscribes():
+def update_affected_users(file_ids: list[str]):
+    """
+    Rebuild the master list of every user linked to any of the files,
+    once per user no matter how many of their files changed.
+    """
+    if not file_ids:
+        return
+    for user_email in get_user_emails_for_files(file_ids):
+        master_list_recompiler.mark_dirty(user_email)
+
+    for user_email, ok in master_list_recompiler.flush().items():
+        if ok:
+            print(f"Updated master list for affected user {user_email}")
+        else:
+            print(f"Failed to master list for affected user {user_email}")
+
+def load_pending_updates():
+    """
+    Load every pending unsubscribe and contact change.
+    Returns (unsubscribe ids, set of emails to remove, contact change ids,
+    dict old email -> (new email, new name)), with emails normalized to lowercase.
+    """
+    unsubscribes = supabase.table("unsubscribe_emails").select("id, email").execute().data or []
+    changes = supabase.table("contact_changes").select("id, old_email, new_email, new_name").execute().data or []
+
+    removals = {entry["email"].strip().lower() for entry in unsubscribes if entry.get("email")}
+
+    renames = {}
+    for change in changes:
+        old_email = (change.get("old_email") or "").strip().lower()
+        if not old_email:
+            continue
+        if not change.get("new_email"):
+            logger.warning(f"Contact change for {old_email} has no new email, skipping.")
+            continue
+        renames[old_email] = (change["new_email"].strip(), change.get("new_name") or "")
+
+    # Collapse chains like a -> b, b -> c so a single lookup gives the final contact
+    for old_email in list(renames):
+        seen = {old_email}
+        new_email, new_name = renames[old_email]
+        while new_email.lower() in renames and new_email.lower() not in seen:
+            seen.add(new_email.lower())
+            new_email, new_name = renames[new_email.lower()]
+        renames[old_email] = (new_email, new_name)
+
+    return [e["id"] for e in unsubscribes], removals, [c["id"] for c in changes], renames
+
+def apply_updates_to_file(file: dict, removals: set[str], renames: dict[str, tuple[str, str]]) -> bool:
+    """
+    Apply all removals and renames to one list file in a single pass over
+    its rows, writing it back once if anything changed.
+    Returns True if the file was modified.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(open_file_data(file["file_data"]), encoding="utf-8", newline=""))
+    email_key = find_email_key(reader.fieldnames or [])
+    if not email_key:
+        logger.warning(f"No 'email' column found in file {file['id']}, skipping.")
+        return False
+    name_key = find_name_key(reader.fieldnames)
+    if renames and not name_key:
+        logger.warning(f"No 'name' column found in file {file['id']}, only applying unsubscribes.")
+
+    updated_rows = []
+    modified = False
+    for row in reader:
+        email = (row.get(email_key) or "").strip().lower()
+        if email in removals:
+            modified = True
+            continue
+        if name_key and email in renames:
+            row[email_key], row[name_key] = renames[email]
+            modified = True
+        updated_rows.append(row)
+
+    if modified:
+        update_file_data(file["id"], updated_rows, reader.fieldnames)
+    return modified
+
+def apply_updates_to_files(files, removals: set[str], renames: dict[str, tuple[str, str]]) -> list[str]:
+    modified_ids = []
+    for file in files:
+        try:
+            if apply_updates_to_file(file, removals, renames):
+                modified_ids.append(file["id"])
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            logger.warning(f"Could not process file {file['id']}: {e}")
+    return modified_ids
+
+def process_pending_updates():
+    """
+    Apply all pending unsubscribes and contact changes to the Admin's list
+    files (and their renamed copies), reading and writing each file once.
+    """
     try:
-        response = supabase.table("unsubscribe_emails").select("*").execute()
-        unsubscribes = response.data
-        admin = supabase.table("users").select("id").eq("name", "Admin").execute().data[0]
-        list_files = supabase.table("list_files").select("*").eq("created_by", admin["id"]).execute().data
-
-        for entry in unsubscribes:
-            email = entry["email"]
-            for file in list_files:
-                file_data = decode_file_data_hex(file["file_data"]).decode("utf-8")
-                reader = csv.DictReader(io.StringIO(file_data))
-                email_key = find_email_key(reader.fieldnames)
-                if not email_key:
-                    logger.warning(f"No 'email' column found in file {file['id']}, skipping.")
-                    continue
-                updated_rows = [row for row in reader if row.get(email_key) != email]
-
-                if len(updated_rows) < sum(1 for _ in csv.DictReader(io.StringIO(file_data))):
-                    update_file_data(file["id"], updated_rows, reader.fieldnames)
-                    update_affected_users(file["id"])
-
-                    # Propagate to renamed files
-                    renames = supabase.table("renamed_files").select("new_file_id").eq("original_file_id", file["id"]).execute().data
-                    for rename in renames:
-                        renamed_file = supabase.table("list_files").select("*").eq("id", rename["new_file_id"]).single().execute().data
-                        renamed_data = decode_file_data_hex(renamed_file["file_data"]).decode("utf-8")
-                        renamed_reader = csv.DictReader(io.StringIO(renamed_data))
-                        renamed_email_key = find_email_key(renamed_reader.fieldnames)
-                        if not renamed_email_key:
-                            logger.warning(f"No 'email' column found in renamed file {renamed_file['id']}, skipping.")
-                            continue
-                        renamed_rows = [row for row in renamed_reader if row.get(renamed_email_key) != email]
-                        update_file_data(renamed_file["id"], renamed_rows, renamed_reader.fieldnames)
-                        update_affected_users(renamed_file["id"])
-
-            supabase.table("unsubscribe_emails").delete().eq("id", entry["id"]).execute()
-    except Exception as e:
-        logger.error(f"Error processing unsubscribes: {e}")
+        unsubscribe_ids, removals, change_ids, renames = load_pending_updates()
+        if not unsubscribe_ids and not change_ids:
+            logger.info("No pending unsubscribes or contact changes.")
+            return
 
-
-def process_contact_changes():
-    try:
-        response = supabase.table("contact_changes").select("*").execute()
-        changes = response.data
         admin = supabase.table("users").select("id").eq("name", "Admin").execute().data[0]
-        list_files = supabase.table("list_files").select("*").eq("created_by", admin["id"]).execute().data
-
-        for change in changes:
-            old_email = change["old_email"]
-            new_email = change["new_email"]
-            new_name = change["new_name"]
-
-            for file in list_files:
-                file_data = decode_file_data_hex(file["file_data"]).decode("utf-8")
-                reader = csv.DictReader(io.StringIO(file_data))
-                email_key = find_email_key(reader.fieldnames)
-                name_key = find_name_key(reader.fieldnames)
-                if not email_key or not name_key:
-                    logger.warning(f"Missing 'email' or 'name' columns in file {file['id']}, skipping.")
-                    continue
-                updated_rows = []
-                modified = False
-
-                for row in reader:
-                    if row.get(email_key) == old_email:
-                        row[email_key] = new_email
-                        row[name_key] = new_name
-                        modified=True
-                    updated_rows.append(row)
-
-                if modified:
-                    update_file_data(file["id"], updated_rows, reader.fieldnames)
-                    update_affected_users(file["id"])
-
-                    # Propagate to renamed files
-                    renames = supabase.table("renamed_files").select("new_file_id").eq("original_file_id", file["id"]).execute().data
-                    for rename in renames:
-                        renamed_file = supabase.table("list_files").select("*").eq("id", rename["new_file_id"]).single().execute().data
-                        renamed_data = decode_file_data_hex(renamed_file["file_data"]).decode("utf-8")
-                        renamed_reader = csv.DictReader(io.StringIO(renamed_data))
-                        renamed_email_key = find_email_key(renamed_reader.fieldnames)
-                        renamed_name_key = find_name_key(renamed_reader.fieldnames)
-                        if not renamed_email_key or not renamed_name_key:
-                            logger.warning(f"Missing columns in renamed file {renamed_file['id']}, skipping.")
-                            continue
-                        renamed_rows = []
-                        renamed_modified = False
-
-                        for row in renamed_reader:
-                            if row.get(renamed_email_key) == old_email:
-                                row[renamed_email_key] = new_email
-                                row[renamed_name_key] = new_name
-                                renamed_modified = True
-
-                        if renamed_modified:
-                            update_file_data(renamed_file["id"], renamed_rows, renamed_reader.fieldnames)
-                            update_affected_users(renamed_file["id"])
-
-            supabase.table("contact_changes").delete().eq("id", change["id"]).execute()
+        list_files = fetch_files_created_by(admin["id"])
+        modified_ids = apply_updates_to_files(list_files, removals, renames)
+
+        # Propagate to renamed files
+        if modified_ids:
+            renames_rows = supabase.table("renamed_files").select("new_file_id").in_("original_file_id", modified_ids).execute().data
+            renamed_ids = list({r["new_file_id"] for r in renames_rows} - set(modified_ids))
+            if renamed_ids:
+                renamed_files = fetch_file_records(renamed_ids)
+                modified_ids += apply_updates_to_files(renamed_files, removals, renames)
+
+        update_affected_users(modified_ids)
+
+        if unsubscribe_ids:
+            supabase.table("unsubscribe_emails").delete().in_("id", unsubscribe_ids).execute()
+        if change_ids:
+            supabase.table("contact_changes").delete().in_("id", change_ids).execute()
+        logger.info(f"Applied {len(removals)} unsubscribes and {len(renames)} contact changes to {len(modified_ids)} files.")
     except Exception as e:
-        logger.error(f"Error processing contact changes: {e}")
-        print(f"Error processing contact changes: {e}")
+        logger.error(f"Error processing unsubscribes and contact changes: {e}")
+        print(f"Error processing unsubscribes and contact changes: {e}")
 
 
 def run_regular_updates():
     logger.info("Starting regular contact updates...")
     print(("Starting regular contact updates..."))
-    process_unsubscribes()
-    process_contact_changes()
+    process_pending_updates()
     logger.info("Completed regular contact updates.")
     
 run_regular_updates()
\ No newline at end of file
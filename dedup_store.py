@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import DEDUP_TTL, DEDUP_MEMORY_SIZE
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Purge expired rows from SQLite at most this often (seconds)
+PURGE_INTERVAL = 600
+
+class MessageDedupStore:
+    """
+    Claims on message IDs that expire after `ttl` seconds.
+    A bounded in-memory LRU answers repeat lookups; the SQLite table in the
+    local state database makes claims survive restarts and be atomic across
+    every worker and process sharing it.
+    """
+
+    def __init__(self, ttl: float = DEDUP_TTL, max_memory: int = DEDUP_MEMORY_SIZE):
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self._recent: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _key(mailbox: str, message_id: str) -> str:
+        return f"{mailbox.lower()}:{message_id}"
+
+    def _conn(self):
+        conn = get_connection()
+        if not self._table_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_messages ("
+                " message_key TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+            )
+            self._table_ready = True
+        return conn
+
+    def _purge_expired(self, now: float):
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        removed = self._conn().execute(
+            "DELETE FROM processed_messages WHERE claimed_at < ?", (now - self.ttl,)
+        ).rowcount
+        if removed:
+            logger.info("Purged %d expired message claims", removed)
+
+    def claim(self, mailbox: str, message_id: str) -> bool:
+        """
+        Atomically claim a message for processing.
+        Returns False if it was already claimed within the TTL.
+        """
+        key = self._key(mailbox, message_id)
+        now = time.time()
+        with self._lock:
+            claimed_at = self._recent.get(key)
+            if claimed_at is not None and now - claimed_at < self.ttl:
+                self._recent.move_to_end(key)
+                return False
+
+        # Insert, or take over a claim that has expired
+        claimed = self._conn().execute(
+            "INSERT INTO processed_messages (message_key, claimed_at) VALUES (?, ?)"
+            " ON CONFLICT(message_key) DO UPDATE SET claimed_at = excluded.claimed_at"
+            " WHERE processed_messages.claimed_at < ?",
+            (key, now, now - self.ttl),
+        ).rowcount == 1
+
+        with self._lock:
+            if claimed:
+                self._recent[key] = now
+                self._recent.move_to_end(key)
+                while len(self._recent) > self.max_memory:
+                    self._recent.popitem(last=False)
+            self._purge_expired(now)
+        return claimed
+
+    def release(self, mailbox: str, message_id: str):
+        """
+        Give up a claim so the message can be processed again later.
+        """
+        key = self._key(mailbox, message_id)
+        with self._lock:
+            self._recent.pop(key, None)
+        self._conn().execute("DELETE FROM processed_messages WHERE message_key = ?", (key,))
@@ -0,0 +1,118 @@
+import datetime
+import logging
+import threading
+import time
+from config import DELTA_SYNC_GRACE
+from local_store import get_connection
+from notification_queue import NotificationQueueFull
+
+logger = logging.getLogger(__name__)
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _timestamp(value: str) -> float:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+class DeltaSync:
+    """
+    Catches up on Inbox mail that arrived while we weren't receiving
+    notifications, using Graph delta queries.
+    The deltaLink for each mailbox is persisted in the local state database,
+    so each run only pages through changes since the last one. New messages
+    are fed to `enqueue(mailbox, resource)` and deduplicated downstream by
+    the message claim in process_email_notification.
+    """
+
+    def __init__(self, graph, enqueue):
+        self.graph = graph
+        self.enqueue = enqueue
+        self._table_ready = False
+        self._mailbox_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection()
+        if not self._table_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS delta_links ("
+                " mailbox TEXT PRIMARY KEY, delta_link TEXT, synced_at REAL NOT NULL)"
+            )
+            self._table_ready = True
+        return conn
+
+    def _load_state(self, mailbox: str) -> tuple[str | None, float | None]:
+        row = self._conn().execute(
+            "SELECT delta_link, synced_at FROM delta_links WHERE mailbox = ?", (mailbox.lower(),)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def _save_state(self, mailbox: str, delta_link: str | None, synced_at: float):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO delta_links (mailbox, delta_link, synced_at) VALUES (?, ?, ?)",
+            (mailbox.lower(), delta_link, synced_at),
+        )
+
+    def sync_mailbox(self, mailbox: str) -> int:
+        """
+        Run one catch-up pass for the mailbox. Returns the number of messages queued.
+        """
+        with self._lock:
+            mailbox_lock = self._mailbox_locks.setdefault(mailbox.lower(), threading.Lock())
+        if not mailbox_lock.acquire(blocking=False):
+            logger.info("Delta sync already running for %s", mailbox)
+            return 0
+        try:
+            return self._sync(mailbox)
+        finally:
+            mailbox_lock.release()
+
+    def _sync(self, mailbox: str) -> int:
+        started = time.time()
+        page_url, synced_at = self._load_state(mailbox)
+        # Only pick up mail received since the last pass; older messages
+        # that merely changed (read, flagged, ...) were handled back then
+        received_since = (synced_at or started) - DELTA_SYNC_GRACE
+        if page_url is None:
+            logger.info("Starting delta sync for %s from %s", mailbox, _iso(received_since))
+
+        queued = 0
+        while True:
+            page = self.graph.get_inbox_delta_page(mailbox, page_url, _iso(received_since))
+            if page is None:
+                if page_url is None or synced_at is None:
+                    logger.error("Delta sync for %s could not be started", mailbox)
+                    return queued
+                # Sync state expired: start over from the last successful pass
+                page_url, synced_at = None, None
+                continue
+
+            messages, next_link, delta_link = page
+            for message in messages:
+                if "@removed" in message or not message.get("id"):
+                    continue
+                received = message.get("receivedDateTime")
+                if received and _timestamp(received) < received_since:
+                    continue
+                resource = f"users/{mailbox}/mailFolders('Inbox')/messages/{message['id']}"
+                try:
+                    self.enqueue(mailbox, resource)
+                except NotificationQueueFull:
+                    # Don't advance the deltaLink; the next pass picks these up again
+                    logger.warning("Queue full during delta sync for %s, will retry later", mailbox)
+                    return queued
+                queued += 1
+
+            if next_link:
+                page_url = next_link
+                continue
+            self._save_state(mailbox, delta_link, started)
+            logger.info("Delta sync for %s queued %d messages", mailbox, queued)
+            return queued
+
+    def sync_all(self, mailboxes):
+        for mailbox in sorted(set(mailboxes)):
+            try:
+                self.sync_mailbox(mailbox)
+            except Exception as e:
+                logger.error("Delta sync failed for %s: %s", mailbox, e)
@@ -1,17 +1,16 @@
+import hashlib
+import json
 import logging
-from config import OPENAI_API_KEY
-from openai import OpenAI
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import CLASSIFICATION_BATCH_SIZE, CLASSIFICATION_BATCH_SENDERS
+from classification_cache import ClassificationCache
+from llm_gateway import llm_gateway, LLMRateLimitError
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-prompt_template = """
-You are an email classification assistant.
-
-Classify the email content into ONE of the following four categories:
-
-1. Not Interested  
+category_guide = """1. Not Interested  
 → The sender is expressing disinterest in your offering, without explicitly using words like “unsubscribe”.
 
 2. Contact Changed  
@@ -23,27 +22,247 @@ Classify the email content into ONE of the following four categories:
 4. Primary  
 → All other cases. These include general replies, interested leads, or emails that do not clearly fit in the first three categories.
 
----
+"""
+
+prompt_template = """
+You are an email classification assistant.
+
+Classify the email content into ONE of the following four categories:
+
+""" + category_guide + """---
 
-Respond with ONLY the category name: Not Interested, Contact Changed, Unsubscribe, or Primary.
+If the category is Contact Changed, also extract the full name and email address of the new contact provided
+by the sender. Leave new_contact_name and new_contact_email empty when they are not given, or when the
+category is not Contact Changed.
 
 Here is the email:
 
 \"\"\"{email}\"\"\"
 """
 
-def classify_email(email_text: str) -> str:
+batch_prompt_template = """
+You are an email classification assistant.
+
+Classify EACH of the numbered emails below into ONE of the following four categories:
+
+""" + category_guide + """---
+
+For every email classified as Contact Changed, also extract the full name and email address of the new contact
+provided by the sender. Leave new_contact_name and new_contact_email empty when they are not given, or when
+the category is not Contact Changed.
+
+Return exactly one result per email, in the same order as the emails.
+
+Here are the emails:
+
+{emails}
+"""
+
+MODEL = "gpt-4o-mini"
+
+CATEGORIES = ["Not Interested", "Contact Changed", "Unsubscribe", "Primary"]
+
+EMAIL_RE = re.compile(r"^[\w.+'-]+@[\w-]+(?:\.[\w-]+)+$")
+
+RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": CATEGORIES},
+        "new_contact_name": {"type": "string"},
+        "new_contact_email": {"type": "string"},
+    },
+    "required": ["category", "new_contact_name", "new_contact_email"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "email_classification", "strict": True, "schema": RESULT_SCHEMA},
+}
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "email_classifications",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"results": {"type": "array", "items": RESULT_SCHEMA}},
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+FALLBACK_RESULT = {"category": "Primary", "new_contact_name": "", "new_contact_email": ""}
+
+# Changes whenever the prompt or model does, which invalidates cached results
+PROMPT_VERSION = hashlib.sha256((MODEL + prompt_template + batch_prompt_template).encode("utf-8")).hexdigest()[:16]
+
+classification_cache = ClassificationCache(PROMPT_VERSION)
+
+def validate_result(result) -> dict | None:
+    """
+    Check a model result against RESULT_SCHEMA and tidy it up.
+    An implausible contact address is blanked rather than rejecting the label.
+    Returns None if the result is unusable.
+    """
+    if not isinstance(result, dict) or result.get("category") not in CATEGORIES:
+        return None
+    name = result.get("new_contact_name") or ""
+    email = (result.get("new_contact_email") or "").strip()
+    if not isinstance(name, str) or not isinstance(email, str):
+        return None
+    if email and not EMAIL_RE.match(email):
+        logger.warning(f"Ignoring invalid new contact email: {email}")
+        email = ""
+    return {"category": result["category"], "new_contact_name": name.strip(), "new_contact_email": email}
+
+def _request_classification(email_text: str) -> dict:
+    messages = [{"role": "user", "content": prompt_template.format(email=email_text)}]
+    response = llm_gateway.create(
+        model=MODEL,
+        messages=messages,
+        max_tokens=100,
+        temperature=0.3,
+        response_format=RESPONSE_FORMAT
+    )
+    content = response.choices[0].message.content
+    result = validate_result(json.loads(content))
+    if result is None:
+        raise ValueError(f"Malformed classification response: {content}")
+    return result
+
+def _request_batch_classification(email_texts: list[str]) -> list[dict] | None:
+    """
+    Classify several emails in one request.
+    Returns one result per email, or None if the reply isn't usable.
+    """
+    emails = "\n\n".join(f'Email {i}:\n"""{text}"""' for i, text in enumerate(email_texts, 1))
+    messages = [{"role": "user", "content": batch_prompt_template.format(emails=emails)}]
+    response = llm_gateway.create(
+        model=MODEL,
+        messages=messages,
+        max_tokens=20 + 80 * len(email_texts),
+        temperature=0.3,
+        response_format=BATCH_RESPONSE_FORMAT
+    )
+    content = response.choices[0].message.content
+    try:
+        results = [validate_result(r) for r in json.loads(content).get("results")]
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        results = None
+    if results is None or len(results) != len(email_texts) or None in results:
+        logger.warning(f"Malformed batch classification response: {content}")
+        return None
+    return results
+
+class ClassificationBatcher:
+    """
+    Classifies emails from concurrent callers together.
+    An email is sent immediately while fewer than `senders` requests are
+    in flight; emails that arrive while every sender is busy are classified
+    together, up to `max_size` per request, as soon as one frees up.
+    If the batched reply is malformed, each email is classified on its own.
+    """
+
+    def __init__(self, max_size: int = CLASSIFICATION_BATCH_SIZE, senders: int = CLASSIFICATION_BATCH_SENDERS):
+        self.max_size = max_size
+        self.senders = max(1, senders)
+        self._pending: list[tuple[str, Future]] = []
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="classify-batch")
+
+    def classify(self, email_text: str) -> dict:
+        future = Future()
+        with self._lock:
+            self._pending.append((email_text, future))
+        self._dispatch()
+        return future.result()
+
+    def _dispatch(self):
+        with self._lock:
+            if not self._pending or self._in_flight >= self.senders:
+                return
+            batch = self._pending[:self.max_size]
+            self._pending = self._pending[self.max_size:]
+            self._in_flight += 1
+        self._executor.submit(self._send_and_continue, batch)
+
+    def _send_and_continue(self, batch: list[tuple[str, Future]]):
+        try:
+            self._send(batch)
+        except Exception as e:
+            logger.error(f"Unexpected error during batch classification: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._dispatch()
+
+    def _send(self, batch: list[tuple[str, Future]]):
+        results = None
+        if len(batch) > 1:
+            try:
+                results = _request_batch_classification([text for text, _ in batch])
+            except LLMRateLimitError as e:
+                # Retrying item by item would only hit the same limit
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            except Exception as e:
+                logger.error(f"Error during batch classification: {e}")
+        if results is not None:
+            logger.info(f"Classified {len(batch)} emails in one request")
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            return
+
+        for text, future in batch:
+            try:
+                future.set_result(_request_classification(text))
+            except Exception as e:
+                future.set_exception(e)
+
+classification_batcher = ClassificationBatcher() if CLASSIFICATION_BATCH_SIZE > 1 else None
+
+def classify_email_with_contact(email_text: str) -> dict:
+    """
+    Classify an email and, for Contact Changed, extract the new contact in
+    the same request.
+    Returns {"category", "new_contact_name", "new_contact_email"}.
+    Raises LLMRateLimitError if OpenAI keeps rate limiting us.
+    """
+    cached, near = classification_cache.get(email_text)
+    if cached:
+        result = json.loads(cached)
+        if not near:
+            logger.info(f"Email classified as: {result['category']} (cached)")
+            return result
+        # A similar email only vouches for the category: the contact it named
+        # belongs to a different message, so Contact Changed is re-extracted
+        if result["category"] != "Contact Changed":
+            logger.info(f"Email classified as: {result['category']} (cached, similar email)")
+            return {"category": result["category"], "new_contact_name": "", "new_contact_email": ""}
+
     try:
-        messages = [{"role": "user", "content": prompt_template.format(email=email_text)}]
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=20,
-            temperature=0.3
-        )
-        classification = response.choices[0].message.content.strip()
-        logger.info(f"Email classified as: {classification}")
-        return classification
+        if classification_batcher is not None:
+            result = classification_batcher.classify(email_text)
+        else:
+            result = _request_classification(email_text)
+        logger.info(f"Email classified as: {result['category']}")
+    except LLMRateLimitError:
+        # Leave the email unclassified rather than misfiling it as Primary
+        raise
     except Exception as e:
         logger.error(f"Error during email classification: {e}")
-        return "Primary"  # default fallback
\ No newline at end of file
+        return dict(FALLBACK_RESULT)  # default fallback
+
+    classification_cache.put(email_text, json.dumps(result))
+    return result
+
+def classify_email(email_text: str) -> str:
+    return classify_email_with_contact(email_text)["category"]
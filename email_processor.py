@@ -1,31 +1,43 @@
-import requests
 import logging
-from graph_client import GraphClient
+from graph_client import get_graph_client
 from supabase_client import is_email_in_master_list, store_contact_change, store_unsubscribe_email
-from bs4 import BeautifulSoup  # type: ignore
-from email_classify import classify_email
-from contact_extract import extract_new_contact_info
+from email_classify import classify_email_with_contact
+from llm_gateway import LLMRateLimitError
+from text_normalizer import message_text, normalize_email_body
+from rule_classifier import classify_by_rules
+from dedup_store import MessageDedupStore
+from collections import Counter
 import re
 
 logger = logging.getLogger(__name__)
 
-# Keep track of already processed emails in this run
-processed_message_ids = set()
-
-def extract_actual_body(html_body: str) -> str:
-    soup = BeautifulSoup(html_body, "html.parser")
-    text = soup.get_text(separator="\n")
-
-    banned_phrases = [
-        "You don't often get email from",
-        "Learn why this is important",
-    ]
-    cleaned_lines = [
-        line.strip()
-        for line in text.splitlines()
-        if not any(banner in line for banner in banned_phrases)
-    ]
-    return "\n".join(filter(None, cleaned_lines)).strip()
+# Inbox subfolders that classified emails can be moved into
+DESTINATION_FOLDERS = [
+    "Not Interested - Companies",
+    "Not Interested - Investors",
+    "Contact Changed",
+    "Unsubscribe",
+]
+
+REPLIES_ALIAS_DOMAIN = "danisavagereplies.com"
+
+# Messages that have already been claimed for processing, shared across restarts and processes
+dedup_store = MessageDedupStore()
+
+# How emails were classified ("rule" or "llm"), to measure LLM traffic avoided by the rules
+classification_paths = Counter()
+
+def body_to_text(body: dict | None, full: bool = False) -> str:
+    """
+    Turn a Graph itemBody into cleaned text. By default the quoted thread,
+    signature and footer are stripped; pass full=True to keep everything.
+    """
+    if not body:
+        return ""
+    content = body.get("content") or ""
+    if full:
+        return message_text(content, body.get("contentType"))
+    return normalize_email_body(content, body.get("contentType"))
 
 def extract_original_sender(forwarded_body: str) -> str:
     # Look for patterns like "From: John Smith <john@example.com>"
@@ -35,47 +47,65 @@ def extract_original_sender(forwarded_body: str) -> str:
     return ""
 
 def process_email_notification(resource_url, user_email):
-    logger.info(f"Fetching email details for: {resource_url}")
-
-    graph = GraphClient()
-    headers = {"Authorization": f"Bearer {graph.token}"}
-
-    response = requests.get(f"https://graph.microsoft.com/v1.0/{resource_url}", headers=headers)
-    if response.status_code != 200:
-        logger.error("Failed to fetch message details: %s", response.text)
+    # Claim the message before doing any work so redeliveries are dropped early
+    message_id = resource_url.rstrip("/").rsplit("/", 1)[-1]
+    if not dedup_store.claim(user_email, message_id):
+        logger.info(f"Duplicate message {message_id}, skipping.")
         return
 
-    data = response.json()
-
-    message_id = data.get("id")
-    if not message_id:
-        logger.warning("No message ID found, skipping.")
-        return
+    try:
+        handled = _process_message(resource_url, user_email, message_id)
+    except Exception:
+        dedup_store.release(user_email, message_id)
+        raise
+    if not handled:
+        # Leave it in the Inbox unprocessed so a redelivery can pick it up
+        dedup_store.release(user_email, message_id)
+
+def _process_message(resource_url, user_email, message_id) -> bool:
+    """
+    Fetch, classify and file one message.
+    Returns False if it could not be processed and should be retried later.
+    """
+    logger.info(f"Fetching email details for: {resource_url}")
 
-    if message_id in processed_message_ids:
-        logger.info(f"Duplicate message {message_id}, skipping.")
-        return
+    graph = get_graph_client()
+    data = graph.get_message(resource_url)
+    if data is None:
+        return False
 
-    processed_message_ids.add(message_id)
+    message_id = data.get("id") or message_id
 
     sender_email = data.get("from", {}).get("emailAddress", {}).get("address", "")
     subject = data.get("subject", "")
-    body = data.get("body", {}).get("content", "")
-    clean_body = extract_actual_body(body)
+    # uniqueBody leaves out the quoted thread; fall back to the full body if it's missing
+    full_body = data.get("body")
+    clean_body = body_to_text(data.get("uniqueBody")) or body_to_text(full_body)
 
     logger.debug(f"Initial From: {sender_email}\nSubject: {subject}\nBody: {clean_body}")
 
     # If email is from replies alias, try to extract original sender
-    if sender_email.endswith("@danisavagereplies.com"):
-        original_sender = extract_original_sender(clean_body)
+    if sender_email.endswith(f"@{REPLIES_ALIAS_DOMAIN}"):
+        # The forwarded header is part of the quoted content, so search the full body
+        original_sender = extract_original_sender(body_to_text(full_body, full=True))
         if original_sender:
             logger.info(f"Detected forwarded email. Original sender: {original_sender}")
             sender_email = original_sender
         else:
             logger.warning("Could not detect original sender in forwarded message.")
 
-    classification = classify_email(clean_body)
-    logger.info(f"Email classified as: {classification}")
+    # Both paths return the category plus any new contact for Contact Changed
+    result = classify_by_rules(clean_body, exclude=[sender_email, user_email, REPLIES_ALIAS_DOMAIN])
+    path = "rule" if result else "llm"
+    if not result:
+        try:
+            result = classify_email_with_contact(clean_body)
+        except LLMRateLimitError as e:
+            logger.error(f"Could not classify message {message_id}: {e}")
+            return False
+    classification = result["category"]
+    classification_paths[path] += 1
+    logger.info(f"Email classified as: {classification} via {path} (totals: {dict(classification_paths)})")
 
     destination_folder = None
 
@@ -87,19 +117,17 @@ def process_email_notification(resource_url, user_email):
 
     elif classification == "Contact Changed":
         destination_folder = "Contact Changed"
-        contact_info = extract_new_contact_info(clean_body)
-        store_contact_change(sender_email, contact_info.get("new_contact_email"), contact_info.get("new_contact_name"))
+        if not result.get("new_contact_email"):
+            logger.warning(f"No new contact address found in Contact Changed email from {sender_email}")
+        store_contact_change(sender_email, result.get("new_contact_email"), result.get("new_contact_name"))
 
     elif classification == "Unsubscribe":
         destination_folder = "Unsubscribe"
         store_unsubscribe_email(sender_email)
 
     if destination_folder:
-        folder_id = graph.get_or_create_subfolder(user_email, destination_folder)
-        if folder_id:
-            graph.move_email_to_folder(user_email, message_id, folder_id)
+        if graph.move_email_to_subfolder(user_email, message_id, destination_folder):
             logger.info(f"Moved email to '{destination_folder}'")
-        else:
-            logger.error(f"Failed to determine folder ID for: {destination_folder}")
     else:
-        logger.info("Keeping email in Inbox")
\ No newline at end of file
+        logger.info("Keeping email in Inbox")
+    return True
@@ -0,0 +1,97 @@
+import base64
+import binascii
+import io
+import zlib
+
+# New rows are stored as FORMAT_MARKER + base64(zlib(file bytes)).
+# Anything without the marker is the legacy hex text ("\x"/"0x"-prefixed or bare).
+FORMAT_MARKER = "zb64:"
+COMPRESSION_LEVEL = 6
+
+# Characters of stored text decoded per step; a multiple of 4 (base64) and 2 (hex)
+DECODE_CHUNK_SIZE = 64 * 1024
+
+class FileDataCodecError(ValueError):
+    pass
+
+def encode_file_data(data: bytes) -> str:
+    """
+    Encode raw file bytes for list_files.file_data.
+    """
+    return FORMAT_MARKER + base64.b64encode(zlib.compress(data, COMPRESSION_LEVEL)).decode("ascii")
+
+# How a framed value looks when a bytea column hands it back as hex
+_HEX_FORMAT_MARKER = FORMAT_MARKER.encode("ascii").hex()
+
+def _hex_start(value: str) -> int:
+    return 2 if value.startswith(("\\x", "0x")) else 0
+
+def is_hex_framed(value: str) -> bool:
+    start = _hex_start(value)
+    return value[start:start + len(_HEX_FORMAT_MARKER)].lower() == _HEX_FORMAT_MARKER
+
+def is_legacy_file_data(value: str) -> bool:
+    """
+    True for hex-encoded raw file bytes, the format before file_codec.
+    """
+    return not value.startswith(FORMAT_MARKER) and not is_hex_framed(value)
+
+def _iter_hex(value: str, chunk_size: int):
+    start = _hex_start(value)
+    for i in range(start, len(value), chunk_size):
+        yield binascii.unhexlify(value[i:i + chunk_size])
+
+def _iter_framed(value: str, chunk_size: int):
+    decompressor = zlib.decompressobj()
+    for i in range(len(FORMAT_MARKER), len(value), chunk_size):
+        yield decompressor.decompress(base64.b64decode(value[i:i + chunk_size], validate=True))
+    yield decompressor.flush()
+    if not decompressor.eof:
+        raise FileDataCodecError("Compressed file data is truncated")
+
+def iter_file_data(value: str, chunk_size: int = DECODE_CHUNK_SIZE):
+    """
+    Yield the raw file bytes stored in a list_files.file_data value,
+    a chunk at a time, whichever format it is in.
+    """
+    try:
+        if value.startswith(FORMAT_MARKER):
+            yield from _iter_framed(value, chunk_size)
+        elif is_hex_framed(value):
+            # A bytea column hands framed text back as hex
+            framed = b"".join(_iter_hex(value, chunk_size)).decode("ascii")
+            yield from _iter_framed(framed, chunk_size)
+        else:
+            yield from _iter_hex(value, chunk_size)
+    except (binascii.Error, zlib.error) as e:
+        raise FileDataCodecError(f"Could not decode file data: {e}") from e
+
+def decode_file_data(value: str) -> bytes:
+    return b"".join(iter_file_data(value))
+
+class FileDataReader(io.RawIOBase):
+    """
+    Readable binary stream over a file_data value, decoded lazily so
+    callers can parse it without materializing the whole file.
+    """
+
+    def __init__(self, value: str):
+        self._chunks = iter_file_data(value)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+def open_file_data(value: str) -> io.BufferedReader:
+    return io.BufferedReader(FileDataReader(value))
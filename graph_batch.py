@@ -0,0 +1,157 @@
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import GRAPH_BATCH_SENDERS, GRAPH_MAX_RETRIES
+from graph_http import parse_retry_after, RETRYABLE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Graph accepts at most 20 requests per $batch call
+GRAPH_BATCH_MAX = 20
+
+class BatchResponse:
+    """
+    One sub-response of a $batch call, shaped like the parts of
+    requests.Response that GraphClient callers use.
+    """
+
+    def __init__(self, status_code: int, headers: dict | None = None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+
+    def json(self):
+        if isinstance(self.body, str):
+            return json.loads(self.body)
+        return self.body
+
+    @property
+    def text(self) -> str:
+        if isinstance(self.body, str):
+            return self.body
+        return json.dumps(self.body) if self.body is not None else ""
+
+class _PendingRequest:
+    def __init__(self, method, url, body, headers):
+        self.method = method
+        self.url = url
+        self.body = body
+        self.headers = headers
+        self.future = Future()
+        self.attempts = 0
+        self.requeued = False
+
+    def to_batch_item(self, item_id: str) -> dict:
+        item = {"id": item_id, "method": self.method, "url": "/" + self.url.lstrip("/")}
+        headers = dict(self.headers or {})
+        if self.body is not None:
+            item["body"] = self.body
+            headers.setdefault("Content-Type", "application/json")
+        if headers:
+            item["headers"] = headers
+        return item
+
+class GraphBatcher:
+    """
+    Coalesces Graph requests from concurrent callers into $batch calls.
+    Requests go out immediately while fewer than `senders` calls are in
+    flight; whatever arrives while every sender is busy is sent together,
+    up to GRAPH_BATCH_MAX per $batch, as soon as one frees up. A lone
+    request is sent on its own rather than wrapped in a $batch.
+    Sub-requests that come back throttled are re-queued after their
+    Retry-After instead of failing the caller.
+    """
+
+    def __init__(self, client, senders: int = GRAPH_BATCH_SENDERS, max_retries: int = GRAPH_MAX_RETRIES):
+        self.client = client
+        self.senders = max(1, senders)
+        self.max_retries = max_retries
+        self._pending: list[_PendingRequest] = []
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="graph-batch")
+
+    def _enqueue(self, pending: _PendingRequest):
+        with self._lock:
+            self._pending.append(pending)
+        self._dispatch()
+
+    def _dispatch(self):
+        with self._lock:
+            if not self._pending or self._in_flight >= self.senders:
+                return
+            batch = self._pending[:GRAPH_BATCH_MAX]
+            self._pending = self._pending[GRAPH_BATCH_MAX:]
+            self._in_flight += 1
+        self._executor.submit(self._send_and_continue, batch)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Queue a request (url relative to the v1.0 endpoint) and block until
+        its response is available.
+        """
+        pending = _PendingRequest(method, url, body, headers)
+        self._enqueue(pending)
+        return pending.future.result()
+
+    def _send_and_continue(self, batch: list[_PendingRequest]):
+        try:
+            self._send(batch)
+        except Exception as e:
+            logger.exception("Unexpected error sending Graph batch")
+            # Never leave a caller blocked on a request we won't answer
+            for p in batch:
+                if not p.future.done() and not p.requeued:
+                    p.future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._dispatch()
+
+    def _send(self, batch: list[_PendingRequest]):
+        for p in batch:
+            p.requeued = False
+        if len(batch) == 1:
+            p = batch[0]
+            try:
+                p.future.set_result(self.client._request(p.method, p.url, json=p.body, headers=p.headers))
+            except Exception as e:
+                p.future.set_exception(e)
+            return
+
+        payload = {"requests": [p.to_batch_item(str(i)) for i, p in enumerate(batch)]}
+        try:
+            resp = self.client._request("POST", "$batch", json=payload)
+        except Exception as e:
+            for p in batch:
+                p.future.set_exception(e)
+            return
+
+        if resp.status_code != 200:
+            logger.error("Graph $batch failed: %s %s", resp.status_code, resp.text)
+            for p in batch:
+                p.future.set_result(BatchResponse(resp.status_code, dict(resp.headers), resp.text))
+            return
+
+        responses = {r.get("id"): r for r in resp.json().get("responses", [])}
+        for i, p in enumerate(batch):
+            sub = responses.get(str(i))
+            if sub is None:
+                p.future.set_result(BatchResponse(500, {}, "Missing sub-response in $batch reply"))
+                continue
+
+            status = sub.get("status", 500)
+            headers = sub.get("headers") or {}
+            if status in RETRYABLE_STATUSES and p.attempts < self.max_retries:
+                p.attempts += 1
+                delay = parse_retry_after(headers.get("Retry-After"))
+                delay = delay if delay is not None else min(2 ** p.attempts, 30)
+                logger.warning("Batched %s %s returned %s, re-queueing in %.1fs", p.method, p.url, status, delay)
+                timer = threading.Timer(delay, self._enqueue, args=(p,))
+                timer.daemon = True
+                timer.start()
+                p.requeued = True
+                continue
+
+            p.future.set_result(BatchResponse(status, headers, sub.get("body")))
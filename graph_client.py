@@ -1,30 +1,183 @@
 import msal
-import requests
 import datetime
 import logging
-from config import CLIENT_ID, CLIENT_SECRET, TENANT_ID, GRAPH_SCOPE
+import threading
+import time
+from config import (
+    CLIENT_ID, CLIENT_SECRET, TENANT_ID, GRAPH_SCOPE, FOLDER_CACHE_TTL, GRAPH_BATCH_ENABLED, SUBSCRIPTION_LIFETIME
+)
+from graph_http import GraphSession, get_graph_session
+from graph_batch import GraphBatcher
 
 logger = logging.getLogger(__name__)
 
-class GraphClient:
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+# Message properties read by email_processor
+MESSAGE_FIELDS = ["id", "from", "subject", "body", "uniqueBody"]
+
+# Refresh tokens this many seconds before they actually expire
+TOKEN_REFRESH_SKEW = 300
+
+class TokenProvider:
+    """
+    Process-wide source of app-only Graph tokens.
+    Holds a single MSAL application (and therefore a single token cache) and
+    refreshes ahead of expiry under a lock, so concurrent callers share one
+    AAD round trip instead of each doing their own.
+    """
+
     def __init__(self):
-        self.token = None
+        self._app = None
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _get_app(self):
+        if self._app is None:
+            authority = f"https://login.microsoftonline.com/{TENANT_ID}"
+            self._app = msal.ConfidentialClientApplication(
+                CLIENT_ID, authority=authority, client_credential=CLIENT_SECRET
+            )
+        return self._app
+
+    def _is_fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - TOKEN_REFRESH_SKEW
+
+    def get_token(self, stale_token: str | None = None) -> str:
+        """
+        Return a valid access token.
+        Pass the token that was just rejected as `stale_token` to force a
+        refresh; if another thread already replaced it, the new one is reused.
+        """
+        if stale_token is None and self._is_fresh():
+            return self._token
+
+        with self._lock:
+            if stale_token is None and self._is_fresh():
+                return self._token
+            if stale_token is not None and self._token not in (None, stale_token):
+                return self._token
+            if stale_token is not None:
+                # Drop the MSAL cache so the rejected token isn't handed back
+                self._app = None
+
+            result = self._get_app().acquire_token_for_client(scopes=GRAPH_SCOPE)
+            if "access_token" not in result:
+                raise Exception("Could not obtain access token: " + str(result))
+
+            self._token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 3599))
+            return self._token
+
+_token_provider = TokenProvider()
+
+def subscription_expiration() -> str:
+    # Expiration SUBSCRIPTION_LIFETIME from now in UTC, no microseconds
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=SUBSCRIPTION_LIFETIME)
+    return expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class FolderCache:
+    """
+    Maps (mailbox, folder name) to a mail folder ID for `ttl` seconds.
+    Misses are single-flight: concurrent lookups for the same key wait for
+    one loader instead of racing to create duplicate folders.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[tuple[str, str], tuple[str, float]] = {}
+        self._key_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(mailbox: str, folder_name: str) -> tuple[str, str]:
+        return mailbox.lower(), folder_name.lower()
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def get_or_load(self, mailbox: str, folder_name: str, loader):
+        key = self._key(mailbox, folder_name)
+        folder_id = self._get_fresh(key)
+        if folder_id:
+            return folder_id
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            folder_id = self._get_fresh(key)
+            if folder_id:
+                return folder_id
+            folder_id = loader()
+            if folder_id:
+                self._entries[key] = (folder_id, time.monotonic() + self.ttl)
+            return folder_id
+
+    def invalidate(self, mailbox: str, folder_name: str | None = None):
+        """
+        Drop one cached folder, or every folder for the mailbox if no name is given.
+        """
+        with self._lock:
+            if folder_name is not None:
+                self._entries.pop(self._key(mailbox, folder_name), None)
+                return
+            for key in [k for k in self._entries if k[0] == mailbox.lower()]:
+                del self._entries[key]
+
+_folder_cache = FolderCache(FOLDER_CACHE_TTL)
+
+class GraphClient:
+    def __init__(self, token_provider: TokenProvider | None = None, session: GraphSession | None = None,
+                 folder_cache: FolderCache | None = None):
+        self.token_provider = token_provider or _token_provider
+        self.session = session or get_graph_session()
+        self.folder_cache = folder_cache or _folder_cache
+        self.batcher = GraphBatcher(self) if GRAPH_BATCH_ENABLED else None
         self.get_token()
 
+    @property
+    def token(self) -> str:
+        return self.token_provider.get_token()
+
     def get_token(self):
-        authority = f"https://login.microsoftonline.com/{TENANT_ID}"
-        app = msal.ConfidentialClientApplication(
-            CLIENT_ID, authority=authority, client_credential=CLIENT_SECRET
-        )
-        result = app.acquire_token_for_client(scopes=GRAPH_SCOPE)
-        if "access_token" in result:
-            self.token = result["access_token"]
-        else:
-            raise Exception("Could not obtain access token: " + str(result))
+        return self.token_provider.get_token()
+
+    def _request(self, method, url, **kwargs):
+        """
+        Send an authenticated request to Graph over the shared session,
+        retrying once with a fresh token if the current one is rejected
+        with a 401. Throttling and transient errors are retried by the session.
+        `url` may be absolute or relative to the v1.0 endpoint.
+        """
+        if not url.startswith("https://"):
+            url = f"{GRAPH_BASE_URL}/{url.lstrip('/')}"
+        headers = dict(kwargs.pop("headers", None) or {})
+
+        token = self.token_provider.get_token()
+        headers["Authorization"] = f"Bearer {token}"
+        resp = self.session.request(method, url, headers=headers, **kwargs)
+
+        if resp.status_code == 401:
+            logger.info("Graph rejected token for %s %s, refreshing", method, url)
+            headers["Authorization"] = f"Bearer {self.token_provider.get_token(stale_token=token)}"
+            resp = self.session.request(method, url, headers=headers, **kwargs)
+        return resp
+
+    def _batched_request(self, method, url, json=None, headers=None):
+        """
+        Send a request through the $batch coalescer when batching is enabled,
+        otherwise directly. `url` must be relative to the v1.0 endpoint.
+        """
+        if self.batcher is None:
+            return self._request(method, url, json=json, headers=headers)
+        return self.batcher.request(method, url, body=json, headers=headers)
 
-    def subscribe_to_mail(self, notification_url, user_email):
-        # 1) Compute expiration 2 days from now in UTC, no microseconds:
-        expiration = (datetime.datetime.now() + datetime.timedelta(days=2)).replace(microsecond=0).isoformat() + "Z"
+    def subscribe_to_mail(self, notification_url, user_email, lifecycle_notification_url=None):
+        expiration = subscription_expiration()
 
         resource = f"users/{user_email}/mailFolders('Inbox')/messages"
         payload = {
@@ -34,17 +187,10 @@ class GraphClient:
             "expirationDateTime": expiration,
             "clientState": "secretClientValue"
         }
+        if lifecycle_notification_url:
+            payload["lifecycleNotificationUrl"] = lifecycle_notification_url
 
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-
-        resp = requests.post(
-            "https://graph.microsoft.com/v1.0/subscriptions",
-            headers=headers,
-            json=payload
-        )
+        resp = self._request("POST", "subscriptions", json=payload)
 
         if resp.status_code in (200, 201):
             logger.info("Webhook subscription created!")
@@ -53,65 +199,166 @@ class GraphClient:
             logger.error("Failed to create subscription: %s %s", resp.status_code, resp.text)
             return None
 
-    def get_inbox_folder_id(self, user_email):
-        url = f"https://graph.microsoft.com/v1.0/users/{user_email}/mailFolders/Inbox"
-        response = requests.get(url, headers={"Authorization": f"Bearer {self.token}"})
-        return response.json().get("id")
+    def get_subscription(self, subscription_id):
+        """
+        Returns the subscription JSON, or None if it no longer exists or can't be read.
+        """
+        resp = self._request("GET", f"subscriptions/{subscription_id}")
+        if resp.status_code == 200:
+            return resp.json()
+        if resp.status_code != 404:
+            logger.error("Failed to read subscription %s: %s %s", subscription_id, resp.status_code, resp.text)
+        return None
 
-    def get_or_create_subfolder(self, user_email, folder_name):
-        inbox_id = self.get_inbox_folder_id(user_email)
+    def renew_subscription(self, subscription_id):
+        """
+        Extends a subscription's expiration in place.
+        Returns the updated subscription JSON, or None on failure.
+        """
+        resp = self._request("PATCH", f"subscriptions/{subscription_id}",
+                             json={"expirationDateTime": subscription_expiration()})
+        if resp.status_code == 200:
+            logger.info("Subscription %s renewed", subscription_id)
+            return resp.json()
+        logger.error("Failed to renew subscription %s: %s %s", subscription_id, resp.status_code, resp.text)
+        return None
 
-        # Get existing folders
-        url = f"https://graph.microsoft.com/v1.0/users/{user_email}/mailFolders/{inbox_id}/childFolders"
-        response = requests.get(url, headers={"Authorization": f"Bearer {self.token}"})
-        if response.status_code != 200:
-            logger.error("Error listing folders: %s", response.text)
+    def get_message(self, resource_url):
+        """
+        Fetch a message resource (e.g. users/{mailbox}/messages/{id}).
+        Only the fields the pipeline uses are requested, with bodies as plain
+        text where Graph can convert them.
+        Returns the message JSON, or None if it could not be fetched.
+        """
+        url = f"{resource_url}?$select={','.join(MESSAGE_FIELDS)}"
+        headers = {"Prefer": 'outlook.body-content-type="text"'}
+        resp = self._batched_request("GET", url, headers=headers)
+        if resp.status_code != 200:
+            logger.error("Failed to fetch message details: %s", resp.text)
             return None
+        return resp.json()
 
-        folders = response.json().get("value", [])
-        for f in folders:
-            if f["displayName"].lower() == folder_name.lower():
-                return f["id"]
-
-        # Create folder if not exists
-        url = f"https://graph.microsoft.com/v1.0/users/{user_email}/mailFolders/{inbox_id}/childFolders"
-        response = requests.post(url, json={"displayName": folder_name}, headers={"Authorization": f"Bearer {self.token}"})
-        if response.status_code == 201:
-            return response.json().get("id")
-        else:
-            logger.error("Failed to create folder: %s", response.text)
+    def get_inbox_delta_page(self, user_email, page_url=None, received_since=None):
+        """
+        Fetch one page of Inbox message changes.
+        Start a new sync with page_url=None (only messages received at or
+        after `received_since`, an ISO timestamp), then follow the returned
+        next link until a delta link comes back; pass that on the next sync.
+        Returns (messages, next_link, delta_link), or None if the sync state
+        is no longer valid and a new sync must be started.
+        """
+        if page_url is None:
+            page_url = (f"users/{user_email}/mailFolders/inbox/messages/delta"
+                        f"?$select=id,receivedDateTime&$filter=receivedDateTime ge {received_since}")
+        resp = self._request("GET", page_url, headers={"Prefer": "odata.maxpagesize=50"})
+        if resp.status_code in (400, 404, 410):
+            logger.warning("Delta sync state rejected for %s: %s %s", user_email, resp.status_code, resp.text)
             return None
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get("value", []), data.get("@odata.nextLink"), data.get("@odata.deltaLink")
+
+    def get_or_create_subfolder(self, user_email, folder_name):
+        """
+        Resolve an Inbox child folder by display name, creating it if needed.
+        Results are cached per mailbox; see FolderCache.
+        """
+        return self.folder_cache.get_or_load(
+            user_email, folder_name, lambda: self._find_or_create_subfolder(user_email, folder_name)
+        )
+
+    def _find_or_create_subfolder(self, user_email, folder_name):
+        # "inbox" is a well-known folder name, so no lookup of its ID is needed
+        url = f"users/{user_email}/mailFolders/inbox/childFolders"
+        escaped = folder_name.replace("'", "''")
+
+        for attempt in range(2):
+            response = self._request("GET", url, params={"$filter": f"displayName eq '{escaped}'"})
+            if response.status_code != 200:
+                logger.error("Error listing folders: %s", response.text)
+                return None
+
+            folders = response.json().get("value", [])
+            for f in folders:
+                if f["displayName"].lower() == folder_name.lower():
+                    return f["id"]
+
+            if attempt:
+                break
+
+            # Create folder if not exists
+            response = self._request("POST", url, json={"displayName": folder_name})
+            if response.status_code == 201:
+                return response.json().get("id")
+            if response.status_code != 409:
+                break
+            # Someone else created it in the meantime; look it up again
+
+        logger.error("Failed to create folder: %s", response.text)
+        return None
+
+    def warm_folder_cache(self, user_email, folder_names):
+        for name in folder_names:
+            try:
+                if not self.get_or_create_subfolder(user_email, name):
+                    logger.warning("Could not resolve folder '%s' for %s", name, user_email)
+            except Exception as e:
+                logger.error("Error warming folder '%s' for %s: %s", name, user_email, e)
 
     def move_email_to_folder(self, user_email, message_id, destination_folder_id):
-        url = f"https://graph.microsoft.com/v1.0/users/{user_email}/messages/{message_id}/move"
-        response = requests.post(url, json={"destinationId": destination_folder_id}, headers={"Authorization": f"Bearer {self.token}"})
+        url = f"users/{user_email}/messages/{message_id}/move"
+        response = self._batched_request("POST", url, json={"destinationId": destination_folder_id})
         if response.status_code not in [200, 201]:
             logger.error("Error moving email %s: %s", message_id, response.text)
+            return False, response.status_code
+        return True, response.status_code
+
+    def move_email_to_subfolder(self, user_email, message_id, folder_name):
+        """
+        Move a message into the named Inbox subfolder.
+        If the cached folder ID has gone stale (folder deleted or recreated),
+        the cache entry is dropped and the move retried once.
+        Returns True if the message was moved.
+        """
+        for attempt in range(2):
+            folder_id = self.get_or_create_subfolder(user_email, folder_name)
+            if not folder_id:
+                logger.error("Failed to determine folder ID for: %s", folder_name)
+                return False
+
+            moved, status = self.move_email_to_folder(user_email, message_id, folder_id)
+            if moved:
+                return True
+            if status not in (400, 404) or attempt:
+                return False
+
+            logger.info("Folder '%s' not found for %s, refreshing cached ID", folder_name, user_email)
+            self.folder_cache.invalidate(user_email, folder_name)
+        return False
 
     def unsubscribe(self, subscription_id):
         """
         Deletes a subscription by its ID.
         Returns True if successful, False otherwise.
         """
-        if not self.token:
-            self.get_token()
-
-        url = f"https://graph.microsoft.com/v1.0/subscriptions/{subscription_id}"
-        headers = {
-            "Authorization": f"Bearer {self.token}"
-        }
-
-        resp = requests.delete(url, headers=headers)
+        resp = self._request("DELETE", f"subscriptions/{subscription_id}")
         if resp.status_code == 204:
             logger.info("Subscription %s successfully deleted", subscription_id)
             return True
         else:
             logger.error("Failed to delete subscription %s: %s %s", subscription_id, resp.status_code, resp.text)
-            # In case the token expired, try refreshing once
-            if resp.status_code == 401:
-                self.get_token()
-                resp = requests.delete(url, headers={"Authorization": f"Bearer {self.token}"})
-                if resp.status_code == 204:
-                    logger.info("Subscription %s successfully deleted after token refresh.", subscription_id)
-                    return True
-            return False
\ No newline at end of file
+            return False
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+def get_graph_client() -> GraphClient:
+    """
+    Return the process-wide GraphClient, creating it on first use.
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = GraphClient()
+    return _shared_client
@@ -0,0 +1,136 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    GRAPH_POOL_SIZE,
+    GRAPH_TIMEOUT,
+    GRAPH_MAX_RETRIES,
+    GRAPH_BACKOFF_BASE,
+    GRAPH_BACKOFF_MAX,
+    GRAPH_CIRCUIT_THRESHOLD,
+    GRAPH_CIRCUIT_COOLDOWN,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+class GraphCircuitOpenError(Exception):
+    pass
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed requests and rejects calls
+    for `cooldown` seconds. After the cooldown a single trial request is let
+    through; its outcome closes the circuit or re-opens it.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                raise GraphCircuitOpenError("Graph circuit is open, skipping request")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Graph circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.error("Graph circuit opened after %d consecutive failures", self._failures)
+                self._opened_at = time.monotonic()
+
+class GraphSession:
+    """
+    Keep-alive connection pool for Graph requests.
+    Retries throttling and transient server errors with jittered exponential
+    backoff, honouring Retry-After when Graph sends one.
+    """
+
+    def __init__(self, pool_size: int = GRAPH_POOL_SIZE, max_retries: int = GRAPH_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.breaker = CircuitBreaker(GRAPH_CIRCUIT_THRESHOLD, GRAPH_CIRCUIT_COOLDOWN)
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(retry_after, GRAPH_BACKOFF_MAX)
+        # Full jitter
+        return random.uniform(0, min(GRAPH_BACKOFF_MAX, GRAPH_BACKOFF_BASE * (2 ** attempt)))
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", GRAPH_TIMEOUT)
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                logger.warning("Graph %s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            else:
+                # Throttling means Graph is up, so only 5xx count against the circuit
+                if resp.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                if resp.status_code not in RETRYABLE_STATUSES:
+                    return resp
+                if attempt >= self.max_retries:
+                    return resp
+                delay = self._backoff(attempt, parse_retry_after(resp.headers.get("Retry-After")))
+                logger.warning("Graph %s %s returned %s, retrying in %.1fs", method, url, resp.status_code, delay)
+
+            time.sleep(delay)
+            attempt += 1
+
+_graph_session = GraphSession()
+
+def get_graph_session() -> GraphSession:
+    return _graph_session
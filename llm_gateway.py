@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from openai import AsyncOpenAI, RateLimitError, APIStatusError, APIConnectionError, APITimeoutError
+from config import OPENAI_API_KEY, LLM_MAX_IN_FLIGHT, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES
+from graph_http import parse_retry_after
+from text_normalizer import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+class LLMRateLimitError(Exception):
+    pass
+
+def estimate_tokens(messages: list[dict], max_tokens: int) -> int:
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return prompt_chars // CHARS_PER_TOKEN + max_tokens
+
+class TokenBucket:
+    """
+    Async token bucket holding up to `per_minute` tokens, refilled continuously.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class LLMGateway:
+    """
+    Single AsyncOpenAI client shared by every module that calls the model.
+    Requests run on a dedicated event loop thread, capped at `max_in_flight`
+    concurrent calls and paced by request and estimated-token buckets sized
+    to our per-minute quota. Rate limits and transient errors are retried
+    with backoff; LLMRateLimitError is raised once retries run out.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE, max_retries: int = LLM_MAX_RETRIES):
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                    asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                    self._loop = loop
+        return self._loop
+
+    async def _setup(self):
+        # The gateway does its own retrying
+        self._client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    async def acreate(self, **kwargs):
+        """
+        chat.completions.create with concurrency, quota and retry handling.
+        """
+        estimated = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens") or 0)
+        attempt = 0
+        while True:
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated)
+            async with self._in_flight:
+                try:
+                    return await self._client.chat.completions.create(**kwargs)
+                except RateLimitError as e:
+                    if attempt >= self.max_retries:
+                        raise LLMRateLimitError(f"OpenAI rate limit persisted after {attempt} retries: {e}") from e
+                    retry_after = parse_retry_after(e.response.headers.get("retry-after")) if e.response else None
+                    delay = min(retry_after, BACKOFF_MAX) if retry_after is not None else self._backoff(attempt)
+                    logger.warning(f"OpenAI rate limited, retrying in {delay:.1f}s")
+                except (APIConnectionError, APITimeoutError) as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"OpenAI request failed ({e}), retrying in {delay:.1f}s")
+                except APIStatusError as e:
+                    if e.status_code < 500 or attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"OpenAI returned {e.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def create(self, **kwargs):
+        """
+        Blocking wrapper around acreate for use from worker threads.
+        """
+        return asyncio.run_coroutine_threadsafe(self.acreate(**kwargs), self._ensure_loop()).result()
+
+llm_gateway = LLMGateway()
@@ -0,0 +1,23 @@
+import os
+import sqlite3
+import threading
+from config import LOCAL_STATE_DIR
+
+DB_FILENAME = "state.db"
+
+_local = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's connection to the local state database.
+    The database runs in WAL mode with autocommit, so worker threads and
+    other processes on the host can share it with atomic single statements.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(LOCAL_STATE_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(LOCAL_STATE_DIR, DB_FILENAME), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
@@ -1,11 +1,21 @@
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
 from webhook_listener import app
-from graph_client import GraphClient
+from graph_client import get_graph_client
 from daily_contact_updater import run_regular_updates
 from apscheduler.schedulers.background import BackgroundScheduler
 from supabase_client import supabase
+from email_processor import process_email_notification, DESTINATION_FOLDERS
+from notification_queue import NotificationQueue
+from subscription_manager import SubscriptionManager
+from delta_sync import DeltaSync
+from config import (
+    NOTIFICATION_WORKERS, NOTIFICATION_QUEUE_SIZE, NOTIFICATION_SHUTDOWN_TIMEOUT, SUBSCRIPTION_CHECK_INTERVAL,
+    DELTA_SYNC_INTERVAL
+)
 
 # Configure logging
 logging.basicConfig(
@@ -21,68 +31,117 @@ USER_EMAILS = [
     "kdanisavage@danisavage.com"
 ]
 
-def run_flask():
-    app.run(host="0.0.0.0", port=5000)
+def start_http_server():
+    """
+    Bind the webhook server and serve it from a background thread.
+    The socket is listening once this returns.
+    """
+    server = make_server("0.0.0.0", 5000, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fetch_enabled_emails(emails: list[str]) -> list[str]:
+    result = (
+        supabase
+        .table("inbox_manager_switch")
+        .select("email, status")
+        .in_("email", emails)
+        .execute()
+    )
+    enabled = {row["email"].lower() for row in (result.data or []) if row.get("status")}
+    return [email for email in emails if email.lower() in enabled]
 
 def main():
+    startup_started = phase_started = time.monotonic()
 
-    # 1. Start Flask in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    time.sleep(2)  # Give Flask time to start
+    def log_phase(name):
+        nonlocal phase_started
+        now = time.monotonic()
+        logging.info(f"Startup: {name} took {now - phase_started:.2f}s")
+        phase_started = now
 
-    # 2. public URLs
+    # 0. Start the workers that drain incoming notifications
+    notification_queue = NotificationQueue(process_email_notification, NOTIFICATION_WORKERS, NOTIFICATION_QUEUE_SIZE)
+    notification_queue.start()
+    app.config["NOTIFICATION_QUEUE"] = notification_queue
+
+    # 1. public URLs
     public_url = r"https://webhooks.danisavage.com"
     notification_url = f"{public_url}/notification"
     user_toggle_url = f"{public_url}/user_toggle"
     company_list_update_url = f"{public_url}/company_list_update"
+    lifecycle_url = f"{public_url}/lifecycle"
     
     logging.info(f"Notification URL: {notification_url}")
+    logging.info(f"Lifecycle URL: {lifecycle_url}")
     logging.info(f"User Toggle URL: {user_toggle_url}")
     logging.info(f"Company List Update URL: {company_list_update_url}")
-    
-    # 3. Initialize Graph client and subscribe initial emails
-    graph = GraphClient()
-    subscription_map = {}
+
+    # 2. Save objects in Flask app config for access in endpoints, before any
+    # notification can arrive
+    graph = get_graph_client()
+    subscriptions = SubscriptionManager(graph, notification_url, lifecycle_url)
+    app.config["SUBSCRIPTION_MANAGER"] = subscriptions
+    app.config["SUBSCRIPTION_MAP"] = subscriptions.subscription_map
+    delta_sync = DeltaSync(graph, lambda mailbox, resource: notification_queue.put(mailbox, resource, mailbox))
+    app.config["DELTA_SYNC"] = delta_sync
+    app.config["GRAPH_CLIENT"] = graph
+    app.config["PUBLIC_URL"] = public_url
+
+    # 3. Start Flask; Graph validates new subscriptions against it
+    server = start_http_server()
+    log_phase("HTTP server listening")
+
+    # 4. Subscribe the mailboxes whose switch is on
+    try:
+        enabled_emails = fetch_enabled_emails(USER_EMAILS)
+    except Exception as e:
+        logging.error(f"Error checking inbox switches: {e}")
+        enabled_emails = []
     for email in USER_EMAILS:
+        if email not in enabled_emails:
+            logging.info(f"Skipping subscription for {email} (status = false)")
+    log_phase("switch lookup")
+
+    def start_monitoring(email):
         try:
-            result = (
-                supabase
-                .table("inbox_manager_switch")
-                .select("status")
-                .eq("email", email)
-                .single()
-                .execute()
-            )
-            if result.data and result.data.get("status"):
-                sub = graph.subscribe_to_mail(notification_url, email)
-                if sub and "id" in sub:
-                    subscription_map[sub["id"]] = email
-                    logging.info(f"Subscribed {email} -> {sub['id']}")
-                else:
-                    logging.warning(f"Failed to subscribe {email}")
+            sub_id = subscriptions.ensure_subscription(email)
+            if sub_id:
+                logging.info(f"Subscribed {email} -> {sub_id}")
+                graph.warm_folder_cache(email, DESTINATION_FOLDERS)
             else:
-                logging.info(f"Skipping subscription for {email} (status = false)")
+                logging.warning(f"Failed to subscribe {email}")
         except Exception as e:
-            logging.error(f"Error checking switch for {email}: {e}")
+            logging.error(f"Error subscribing {email}: {e}")
 
-    # 4. Save objects in Flask app config for access in endpoints
-    app.config["SUBSCRIPTION_MAP"] = subscription_map
-    app.config["GRAPH_CLIENT"] = graph
-    app.config["PUBLIC_URL"] = public_url
+    if enabled_emails:
+        with ThreadPoolExecutor(max_workers=len(enabled_emails)) as pool:
+            list(pool.map(start_monitoring, enabled_emails))
+    log_phase("subscriptions")
+
+    def catch_up():
+        delta_sync.sync_all(subscriptions.subscription_map.values())
+
+    # Pick up anything that arrived while we weren't subscribed, without holding up startup
+    threading.Thread(target=catch_up, name="delta-catch-up", daemon=True).start()
 
-    # 6. Schedule any daily jobs if needed
+    # 5. Schedule any daily jobs if needed
     scheduler = BackgroundScheduler()
     scheduler.add_job(run_regular_updates, 'interval', hours = 24)
+    scheduler.add_job(subscriptions.renew_due, 'interval', seconds = SUBSCRIPTION_CHECK_INTERVAL)
+    scheduler.add_job(catch_up, 'interval', seconds = DELTA_SYNC_INTERVAL)
     scheduler.start()
 
-    logging.info("Listening for notifications and webhooks...")
+    logging.info(f"Listening for notifications and webhooks (startup took {time.monotonic() - startup_started:.2f}s)")
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         logging.info("Shutting down…")
+        scheduler.shutdown(wait=False)
+        server.shutdown()
+        notification_queue.shutdown(NOTIFICATION_SHUTDOWN_TIMEOUT)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from config import LOCAL_STATE_DIR
+
+# Downloaded index artifacts are kept here and memory-mapped
+INDEX_DIR = os.path.join(LOCAL_STATE_DIR, "master_list_index")
+
+# Layout: header (magic, format version, reserved, count, crc32 of the body),
+# then `count` sorted, distinct little-endian uint64 address hashes
+MAGIC = b"MLIX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQI4x")
+HASH = struct.Struct("<Q")
+
+class MasterListIndexError(Exception):
+    pass
+
+def email_hash(email: str) -> int:
+    """
+    64-bit hash of a normalized (stripped, lowercase) address.
+    """
+    digest = hashlib.blake2b(email.strip().lower().encode("utf-8"), digest_size=8).digest()
+    return HASH.unpack(digest)[0]
+
+def build_index_bytes(emails) -> bytes:
+    """
+    Serialize a collection of addresses into the binary index format.
+    """
+    hashes = sorted({email_hash(e) for e in emails if e and e.strip()})
+    body = b"".join(HASH.pack(h) for h in hashes)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(hashes), zlib.crc32(body)) + body
+
+class MasterListIndexFile:
+    """
+    Read-only, memory-mapped master list index. Supports `in` and `len`
+    like the frozenset index built from the CSV; lookups binary-search the
+    mapped hashes without parsing anything.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise MasterListIndexError(f"{path} is too short to be an index")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, checksum = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise MasterListIndexError(f"{path} is not a version {FORMAT_VERSION} index")
+        if size != HEADER.size + count * HASH.size:
+            raise MasterListIndexError(f"{path} is truncated")
+        if zlib.crc32(memoryview(self._mm)[HEADER.size:]) != checksum:
+            raise MasterListIndexError(f"{path} failed its checksum")
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, email: str) -> bool:
+        target = email_hash(email)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = HASH.unpack_from(self._mm, HEADER.size + mid * HASH.size)[0]
+            if value < target:
+                lo = mid + 1
+            elif value > target:
+                hi = mid
+            else:
+                return True
+        return False
+
+def store_index_file(user_email: str, data: bytes) -> MasterListIndexFile:
+    """
+    Write a downloaded index to the local index directory and map it.
+    Each user keeps a single file; replacing it leaves existing mappings
+    of the previous one intact.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    name = hashlib.sha1(user_email.lower().encode("utf-8")).hexdigest()
+    path = os.path.join(INDEX_DIR, f"{name}.idx")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    try:
+        index = MasterListIndexFile(tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return index
@@ -0,0 +1,76 @@
+"""
+One-off migration of list_files.file_data from hex text to the
+compressed format in file_codec.
+
+    python migrate_file_data.py [--dry-run] [--batch-size N]
+
+Rows already in the new format are skipped, so it is safe to re-run.
+"""
+import argparse
+import logging
+from file_codec import decode_file_data, encode_file_data, is_legacy_file_data
+from supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+def iter_file_ids(batch_size: int):
+    start = 0
+    while True:
+        rows = (
+            supabase.table("list_files")
+            .select("id")
+            .order("id")
+            .range(start, start + batch_size - 1)
+            .execute()
+            .data
+        ) or []
+        for row in rows:
+            yield row["id"]
+        if len(rows) < batch_size:
+            return
+        start += batch_size
+
+def migrate_file(file_id: str, dry_run: bool) -> tuple[int, int] | None:
+    """
+    Re-encode one file. Returns (old size, new size) in characters,
+    or None if it was already migrated.
+    """
+    res = supabase.table("list_files").select("file_data").eq("id", file_id).single().execute()
+    value = (res.data or {}).get("file_data")
+    if not value or not is_legacy_file_data(value):
+        return None
+    encoded = encode_file_data(decode_file_data(value))
+    if not dry_run:
+        supabase.table("list_files").update({"file_data": encoded}).eq("id", file_id).execute()
+    return len(value), len(encoded)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report savings without writing anything")
+    parser.add_argument("--batch-size", type=int, default=100, help="file IDs fetched per page")
+    args = parser.parse_args()
+
+    migrated = failed = 0
+    old_total = new_total = 0
+    for file_id in iter_file_ids(args.batch_size):
+        try:
+            sizes = migrate_file(file_id, args.dry_run)
+        except Exception as e:
+            logger.error("Failed to migrate file %s: %s", file_id, e)
+            failed += 1
+            continue
+        if sizes is None:
+            continue
+        migrated += 1
+        old_total += sizes[0]
+        new_total += sizes[1]
+        logger.info("%s file %s: %d -> %d chars", "Would migrate" if args.dry_run else "Migrated", file_id, *sizes)
+
+    logger.info(
+        "%s %d files (%d failed): %d -> %d chars",
+        "Would migrate" if args.dry_run else "Migrated", migrated, failed, old_total, new_total,
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
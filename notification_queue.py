@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class NotificationQueueFull(Exception):
+    pass
+
+class NotificationQueue:
+    """
+    Bounded in-process queue drained by a fixed pool of worker threads.
+    Jobs are queued per mailbox and any idle worker takes the next mailbox
+    that isn't already being processed, so notifications for the same
+    mailbox run one at a time and in the order they arrived, while
+    different mailboxes never wait on each other.
+    """
+
+    def __init__(self, handler, workers: int, max_size: int):
+        self.handler = handler
+        self.worker_count = max(1, workers)
+        self.max_size = max(1, max_size)
+        self._pending: dict[str, deque] = {}
+        # Mailboxes with queued jobs and no worker on them, oldest first
+        self._ready: deque[str] = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._accepting = False
+        self._stopping = False
+
+    def start(self):
+        for i in range(self.worker_count):
+            t = threading.Thread(target=self._run, name=f"notification-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._accepting = True
+        logger.info("Started %d notification workers", self.worker_count)
+
+    def put(self, mailbox: str, *args):
+        """
+        Enqueue a job for the given mailbox without blocking.
+        Raises NotificationQueueFull when the queue is full or shutting down.
+        """
+        key = mailbox.lower()
+        with self._cond:
+            if not self._accepting:
+                raise NotificationQueueFull("Notification queue is not accepting work")
+            if self._size >= self.max_size:
+                raise NotificationQueueFull(f"Notification queue full for {mailbox}")
+            jobs = self._pending.get(key)
+            if jobs is None:
+                # Not queued and not being processed: a worker can take it right away
+                jobs = self._pending[key] = deque()
+                self._ready.append(key)
+            jobs.append(args)
+            self._size += 1
+            self._cond.notify()
+
+    def depth(self) -> int:
+        with self._cond:
+            return self._size
+
+    def _next(self) -> tuple[str, tuple] | None:
+        with self._cond:
+            while not self._ready:
+                if self._stopping and not self._size:
+                    return None
+                self._cond.wait()
+            key = self._ready.popleft()
+            self._size -= 1
+            return key, self._pending[key].popleft()
+
+    def _done(self, key: str):
+        with self._cond:
+            if self._pending[key]:
+                # Back of the line, so a busy mailbox can't starve the others
+                self._ready.append(key)
+                self._cond.notify()
+            else:
+                del self._pending[key]
+                if self._stopping and not self._size:
+                    self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            key, args = job
+            try:
+                self.handler(*args)
+            except Exception:
+                logger.exception("Error processing queued notification")
+            finally:
+                self._done(key)
+
+    def shutdown(self, timeout: float) -> bool:
+        """
+        Stop accepting new work and wait up to `timeout` seconds for the
+        workers to drain what is already queued.
+        Returns True if every worker finished in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._accepting = False
+            self._stopping = True
+            logger.info("Draining %d queued notifications...", self._size)
+            self._cond.notify_all()
+
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+        alive = [t.name for t in self._threads if t.is_alive()]
+        if alive:
+            logger.warning("Notification workers still busy after %.0fs: %s", timeout, ", ".join(alive))
+            return False
+        logger.info("Notification queue drained")
+        return True
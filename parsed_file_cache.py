@@ -0,0 +1,58 @@
+import contextlib
+import glob
+import logging
+import os
+import tempfile
+import pandas as pd
+from config import LOCAL_STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(LOCAL_STATE_DIR, "parsed_files")
+
+class ParsedFileCache:
+    """
+    On-disk cache of the contact columns parsed out of each list file,
+    stored as gzipped CSV and keyed by file ID plus a hash of the stored
+    file contents. A file whose contents changed simply misses the cache;
+    its stale entry is replaced on the next put.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, file_id: str, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_id}-{content_hash}.csv.gz")
+
+    def get(self, file_id: str, content_hash: str) -> pd.DataFrame | None:
+        path = self._path(file_id, content_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_csv(path, dtype=str, keep_default_na=False, compression="gzip")
+        except Exception as e:
+            logger.warning("Discarding unreadable cache entry %s: %s", path, e)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+
+    def put(self, file_id: str, content_hash: str, df: pd.DataFrame):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(file_id, content_hash)
+        # Concurrent rebuilds can put the same file at once: each writes its own
+        # temp file, and whichever replace lands last wins with identical contents
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                df.to_csv(f, index=False, compression="gzip")
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{glob.escape(file_id)}-*.csv.gz")):
+            if stale != path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(stale)
+
+parsed_file_cache = ParsedFileCache()
@@ -1,88 +1,187 @@
+import csv
+import hashlib
 import io
 import logging
+import tempfile
 import pandas as pd
 
 from supabase_client import (
     get_user_id_by_email,
     get_user_company_file_ids,
-    fetch_file_record,
-    decode_file_data_hex,
+    fetch_file_records,
     upload_master_list,
     delete_master_list
 )
+from file_codec import decode_file_data
+from parsed_file_cache import parsed_file_cache
 
 logger = logging.getLogger(__name__)
 
+# Every per-file contact frame, and so the master list, uses these columns
+MASTER_LIST_COLUMNS = ["email", "name"]
+
 class RecipientListLoaderError(Exception):
     pass
 
-def read_file_from_bytes(byte_data: bytes) -> pd.DataFrame:
+def find_email_key(headers: list[str]) -> str | None:
+    for h in headers:
+        if str(h).lower() in ('email', 'email id'):
+            return h
+    return None
+
+def find_name_key(headers: list[str]) -> str | None:
+    for h in headers:
+        if str(h).lower() in ('name', 'contact name'):
+            return h
+    return None
+
+# File signatures used to pick a parser without trial and error
+ZIP_MAGIC = b"PK\x03\x04"  # .xlsx (Office Open XML)
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # legacy .xls
+
+def sniff_file_format(byte_data: bytes) -> str:
     """
-    Try to parse byte_data as XLSX, then XLS, then CSV.
-    Raise if all formats fail.
+    Return "xlsx", "xls" or "csv" based on the file's leading bytes.
     """
-    errors = []
-    # XLSX
-    try:
-        return pd.read_excel(io.BytesIO(byte_data), engine="openpyxl")
-    except Exception as e:
-        errors.append(f".xlsx: {e}")
-    # XLS
+    if byte_data.startswith(ZIP_MAGIC):
+        return "xlsx"
+    if byte_data.startswith(OLE2_MAGIC):
+        return "xls"
+    return "csv"
+
+def is_contact_column(header) -> bool:
+    return find_email_key([header]) is not None or find_name_key([header]) is not None
+
+def _read_xlsx_contacts(byte_data: bytes) -> pd.DataFrame:
+    """
+    Stream the first worksheet in read-only mode, keeping only contact columns.
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(io.BytesIO(byte_data), read_only=True, data_only=True)
     try:
-        return pd.read_excel(io.BytesIO(byte_data), engine="xlrd")
-    except Exception as e:
-        errors.append(f".xls: {e}")
-    # CSV
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        keep = [i for i, h in enumerate(header) if h is not None and is_contact_column(h)]
+        data = []
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i in keep]
+            if any(v is not None for v in values):
+                data.append(values)
+        return pd.DataFrame(data, columns=[header[i] for i in keep])
+    finally:
+        wb.close()
+
+def read_file_from_bytes(byte_data: bytes) -> pd.DataFrame:
+    """
+    Parse byte_data as XLSX, XLS or CSV, picking the parser from the file
+    signature, and read only the email and name columns.
+    Raise if the file can't be parsed as the detected format.
+    """
+    file_format = sniff_file_format(byte_data)
     try:
-        return pd.read_csv(io.BytesIO(byte_data))
+        if file_format == "xlsx":
+            return _read_xlsx_contacts(byte_data)
+        if file_format == "xls":
+            return pd.read_excel(io.BytesIO(byte_data), engine="xlrd", usecols=is_contact_column)
+        try:
+            return pd.read_csv(io.BytesIO(byte_data), usecols=is_contact_column, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            return pd.read_csv(io.BytesIO(byte_data), usecols=is_contact_column, encoding="latin-1")
     except Exception as e:
-        errors.append(f".csv: {e}")
+        raise RecipientListLoaderError(f"Could not parse file bytes as .{file_format}: {e}")
+
+def extract_contacts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce a parsed list file to MASTER_LIST_COLUMNS.
+    Files without an email column yield an empty frame.
+    """
+    email_key = find_email_key(list(df.columns))
+    if email_key is None:
+        logger.warning("No email column found among %s", list(df.columns))
+        return pd.DataFrame(columns=MASTER_LIST_COLUMNS)
+    name_key = find_name_key(list(df.columns))
+    contacts = pd.DataFrame({
+        "email": df[email_key],
+        "name": df[name_key] if name_key is not None else "",
+    })
+    contacts = contacts.dropna(subset=["email"]).fillna("").astype(str)
+    return contacts[contacts["email"].str.strip() != ""]
 
-    raise RecipientListLoaderError(
-        "Could not parse file bytes:\n" + "\n".join(errors)
-    )
+def load_file_contacts(record: dict) -> pd.DataFrame:
+    """
+    Contacts from one list_files record, parsed only if the file's
+    contents changed since they were last cached.
+    """
+    content_hash = hashlib.sha256(record["file_data"].encode("utf-8")).hexdigest()[:32]
+    contacts = parsed_file_cache.get(record["id"], content_hash)
+    if contacts is None:
+        raw_bytes = decode_file_data(record["file_data"])
+        contacts = extract_contacts(read_file_from_bytes(raw_bytes))
+        parsed_file_cache.put(record["id"], content_hash, contacts)
+    return contacts
 
-def load_user_recipient_lists(user_email: str) -> dict[str, pd.DataFrame]:
+def iter_user_recipient_lists(user_email: str):
     """
-    Load all recipient list files selected by a user into DataFrames.
-    Returns a dict mapping file_id → DataFrame.
+    Yield (file_id, contacts) for every recipient list file selected by a
+    user, fetching records a page at a time and parsing one file at a time.
     """
     user_id = get_user_id_by_email(user_email)
     if not user_id:
         raise RecipientListLoaderError(f"No user found for email: {user_email}")
 
-    lists: dict[str, pd.DataFrame] = {}
-    file_ids = list(set(get_user_company_file_ids(user_id))) # deduplicated list
+    for record in fetch_file_records(get_user_company_file_ids(user_id)):
+        yield record["id"], load_file_contacts(record)
 
-    for fid in file_ids:
-        record = fetch_file_record(fid)
-        if not record:
-            continue
-        raw_bytes = decode_file_data_hex(record["file_data"])
-        df = read_file_from_bytes(raw_bytes)
-        lists[fid] = df
-
-    return lists
+def write_master_list(contact_frames, out) -> frozenset[str]:
+    """
+    Write MASTER_LIST_COLUMNS rows from each contacts frame to the binary
+    file `out` as CSV, keeping only the first row for each address
+    (compared stripped and lowercase).
+    Returns the set of normalized addresses written.
+    """
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(MASTER_LIST_COLUMNS)
+    seen: set[str] = set()
+    for contacts in contact_frames:
+        for email, name in zip(contacts["email"], contacts["name"]):
+            email = email.strip()
+            key = email.lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            writer.writerow((email, name))
+    # Hand `out` back to the caller still open
+    text.detach()
+    return frozenset(seen)
 
 def compile_and_store_master_list(user_email: str) -> None:
     logger.info(f"Started compiling master list for {user_email}")
     """
-    Fetch, decode, and combine all of a user's recipient lists,
-    then upload the concatenated CSV to Supabase Storage.
+    Stream all of a user's recipient lists, one file at a time, into a
+    deduplicated CSV and upload it to Supabase Storage.
     If no lists are present, remove any existing master list.
     """
-    lists = load_user_recipient_lists(user_email)
-    if not lists:
-        logger.info("No recipient lists found for %s. Deleting master list if it exists.", user_email)
-        delete_master_list(user_email)
-        return
+    file_count = 0
 
-    master_df = pd.concat(lists.values(), ignore_index=True)
+    def contact_frames():
+        nonlocal file_count
+        for _, contacts in iter_user_recipient_lists(user_email):
+            file_count += 1
+            yield contacts
 
-    buffer = io.BytesIO()
-    master_df.to_csv(buffer, index=False)
-    csv_bytes = buffer.getvalue()
+    # Written to disk and uploaded straight from the file, so the CSV is never held in memory
+    with tempfile.NamedTemporaryFile(suffix=".csv") as out:
+        emails = write_master_list(contact_frames(), out)
+        if not file_count:
+            logger.info("No recipient lists found for %s. Deleting master list if it exists.", user_email)
+            delete_master_list(user_email)
+            return
+        out.flush()
 
-    success = upload_master_list(user_email, csv_bytes)
+        logger.info("Master list for %s has %d unique addresses from %d files", user_email, len(emails), file_count)
+        with open(out.name, "rb") as csv_file:
+            success = upload_master_list(user_email, csv_file, email_index=emails)
     if not success:
-        raise RecipientListLoaderError(f"Failed to upload master list for {user_email}")
\ No newline at end of file
+        raise RecipientListLoaderError(f"Failed to upload master list for {user_email}")
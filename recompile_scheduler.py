@@ -0,0 +1,75 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import RECOMPILE_WORKERS, RECOMPILE_DEBOUNCE
+from recipient_list_loader import compile_and_store_master_list
+
+logger = logging.getLogger(__name__)
+
+class RecompileScheduler:
+    """
+    Coalesces master-list rebuilds.
+    Callers mark users dirty; each flush rebuilds every dirty user exactly
+    once, at most `max_workers` at a time. `schedule` flushes automatically
+    `debounce` seconds after the first user is marked, so a burst of list
+    updates for the same user costs a single rebuild.
+    """
+
+    def __init__(self, compile_fn, max_workers: int = RECOMPILE_WORKERS, debounce: float = RECOMPILE_DEBOUNCE):
+        self.compile_fn = compile_fn
+        self.debounce = debounce
+        self._dirty: set[str] = set()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._user_locks: dict[str, threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recompile")
+
+    def mark_dirty(self, user_email: str):
+        with self._lock:
+            self._dirty.add(user_email)
+
+    def schedule(self, user_email: str):
+        """
+        Mark the user dirty and make sure a flush happens within the debounce window.
+        """
+        with self._lock:
+            self._dirty.add(user_email)
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush(wait=False)
+
+    def _compile(self, user_email: str) -> bool:
+        with self._lock:
+            user_lock = self._user_locks.setdefault(user_email, threading.Lock())
+        # A user already being rebuilt is rebuilt again afterwards, so the result reflects the latest lists
+        with user_lock:
+            try:
+                self.compile_fn(user_email)
+                logger.info(f"Updated master list for affected user {user_email}")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to update master list for {user_email}: {e}")
+                return False
+
+    def flush(self, wait: bool = True) -> dict[str, bool]:
+        """
+        Rebuild every dirty user. With wait=True, block until done and
+        return user -> success.
+        """
+        with self._lock:
+            users, self._dirty = sorted(self._dirty), set()
+        if not users:
+            return {}
+        logger.info(f"Recompiling master lists for {len(users)} users")
+        futures = {user: self._executor.submit(self._compile, user) for user in users}
+        if not wait:
+            return {}
+        return {user: future.result() for user, future in futures.items()}
+
+master_list_recompiler = RecompileScheduler(compile_and_store_master_list)
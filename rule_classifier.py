@@ -0,0 +1,110 @@
+import re
+
+# Longer replies are left to the LLM; rules only decide short, unambiguous ones
+MAX_RULE_WORDS = 80
+
+EMAIL_RE = re.compile(r"[\w.+'-]+@[\w-]+(?:\.[\w-]+)+")
+
+def _compile(patterns: list[str]) -> re.Pattern:
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.I)
+
+_UNSUBSCRIBE_RE = _compile([
+    r"\bunsubscribe\b",
+    r"\bremove (?:me|us|my (?:email|address|name))\b",
+    r"\btake (?:me|us|my (?:email|address|name)) off\b",
+    r"\bopt (?:me |us )?out\b",
+    r"\bstop (?:emailing|e-mailing|contacting) (?:me|us)\b",
+    r"\bstop sending (?:me|us|these|this|your (?:emails|e-mails|messages|updates))\b",
+    r"\b(?:do not|don't|please don't) (?:email|e-mail|contact) (?:me|us)\b",
+])
+
+# "do not unsubscribe me", "please don't remove me": the opposite of an unsubscribe
+_NEGATED_UNSUBSCRIBE_RE = _compile([
+    r"\b(?:not|don't|dont|do not|never|won't|no need to)\s+(?:\w+\s+)?"
+    r"(?:unsubscrib\w*|remov\w*|tak\w* (?:me|us|my)|opt\w*|stop\w*)\b",
+])
+
+# Departures must name what was left; a bare "I left" is too often "I left you a voicemail"
+_DEPARTED_FROM = r"(?:the|our|this|that) (?:company|firm|organi[sz]ation|business|fund|team|bank)"
+
+_CONTACT_CHANGED_RE = _compile([
+    r"\bno longer (?:with|at|employed|in (?:this|that|the|my) role|work(?:ing)? (?:at|for|with))\b",
+    rf"\b(?:has|have|I've|I have|I) (?:left|retired from|departed|moved on from) {_DEPARTED_FROM}\b",
+    r"\bI(?:'ve| have)? retired\b",
+    r"\bmy last day\b",
+])
+
+_NOT_INTERESTED_RE = _compile([
+    r"\bnot interested\b",
+    # Only as a whole opening clause, so "no thanks needed" and
+    # "no, thanks for following up" don't count
+    r"\A\W*no,? thanks?(?: you)?\s*(?:[.!;]|,(?!\s*for\b)|$)",
+    r"\bnot (?:a (?:good )?fit|for us|something we(?:'re| are) (?:looking|interested))\b",
+    r"\b(?:we|I)(?:'re| are| am) not looking\b",
+    # "we will pass" or "pass on this", but not "I will pass this along"
+    r"\b(?:we|I)(?:'ll| will) pass(?= on this\b|\s*(?:[.!,;]|$))",
+    r"\bpass on this\b",
+])
+
+# Replies asking for more, or qualifying what they say, are never handled by the rules
+_ENGAGEMENT_RE = _compile([
+    r"\?",
+    r"\b(?:but|however|although|though)\b",
+    r"\b(?:call|calls|meet|meeting|chat|talk|connect|catch up)\b",
+    r"\b(?:schedule|set up (?:a |some )?(?:time|call)|send (?:me|over)|more (?:info|information|details))\b",
+    r"\b(?:happy|glad|love|like) to\b",
+])
+
+# "contact Jane Doe at", "reach out to John Smith (", ...
+_REFERRAL_NAME_RE = re.compile(
+    r"\b(?:contact|reach out to|e-?mail|get in touch with|speak (?:to|with)|colleague)\s+"
+    r"([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+){0,2})\s*(?:at\b|via\b|on\b|:|\(|<|,|-)"
+)
+
+def _new_contact(text: str, exclude: set[str]) -> tuple[str, str] | None:
+    for match in EMAIL_RE.finditer(text):
+        address = match.group(0).rstrip(".'")
+        if address.lower() in exclude or address.lower().split("@")[-1] in exclude:
+            continue
+        name_match = None
+        for candidate in _REFERRAL_NAME_RE.finditer(text, 0, match.start()):
+            name_match = candidate
+        return (name_match.group(1) if name_match else ""), address
+    return None
+
+def classify_by_rules(text: str, exclude: list[str] | None = None) -> dict | None:
+    """
+    Classify short, unambiguous replies without calling the LLM.
+    `exclude` lists addresses or domains that must not be taken as a new
+    contact (the sender, the mailbox owner, ...).
+    Returns a dict with "category", "new_contact_name", "new_contact_email"
+    and the matching "rule", or None when the LLM should decide.
+    """
+    if not text or len(text.split()) > MAX_RULE_WORDS or _ENGAGEMENT_RE.search(text):
+        return None
+
+    matched = []
+    if _NEGATED_UNSUBSCRIBE_RE.search(text):
+        # Acting on a misread unsubscribe deletes the contact, so leave it to the LLM
+        return None
+    if _UNSUBSCRIBE_RE.search(text):
+        matched.append("Unsubscribe")
+    if _CONTACT_CHANGED_RE.search(text):
+        matched.append("Contact Changed")
+    if _NOT_INTERESTED_RE.search(text):
+        matched.append("Not Interested")
+
+    # Asking to unsubscribe while saying you're not interested is still an unsubscribe
+    if matched == ["Unsubscribe", "Not Interested"]:
+        matched = ["Unsubscribe"]
+    if len(matched) != 1:
+        return None
+
+    result = {"category": matched[0], "new_contact_name": "", "new_contact_email": "", "rule": matched[0].lower()}
+    if matched[0] == "Contact Changed":
+        contact = _new_contact(text, {e.lower() for e in exclude or [] if e})
+        if not contact:
+            # Left the company without naming a replacement: let the LLM decide
+            return None
+        result["new_contact_name"], result["new_contact_email"] = contact
+    return result
@@ -0,0 +1,215 @@
+import datetime
+import heapq
+import logging
+import threading
+from config import SUBSCRIPTION_RENEW_BEFORE
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+def parse_graph_datetime(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class SubscriptionManager:
+    """
+    Owns the Graph mail subscriptions for every monitored mailbox.
+    Subscriptions are persisted in the local state database so a restart
+    can reuse (or renew) the ones that are still alive instead of creating
+    duplicates. `subscription_map` maps subscription ID -> mailbox and is
+    shared with the webhook endpoints.
+    Live subscriptions sit in a min-heap keyed by expiry; `renew_due` is run
+    periodically by the scheduler and renews in place (PATCH) whatever is
+    within SUBSCRIPTION_RENEW_BEFORE of lapsing.
+    """
+
+    def __init__(self, graph, notification_url: str, lifecycle_notification_url: str | None = None):
+        self.graph = graph
+        self.notification_url = notification_url
+        self.lifecycle_notification_url = lifecycle_notification_url
+        self.subscription_map: dict[str, str] = {}
+        self._expirations: dict[str, datetime.datetime] = {}
+        self._errors: dict[str, str] = {}
+        self._expiry_heap: list[tuple[datetime.datetime, str]] = []
+        self._lock = threading.RLock()
+        self._table_ready = False
+
+    def _conn(self):
+        conn = get_connection()
+        if not self._table_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscriptions ("
+                " id TEXT PRIMARY KEY, mailbox TEXT NOT NULL, notification_url TEXT NOT NULL,"
+                " expiration TEXT NOT NULL)"
+            )
+            self._table_ready = True
+        return conn
+
+    def _persisted_ids(self, mailbox: str) -> list[str]:
+        rows = self._conn().execute(
+            "SELECT id FROM subscriptions WHERE mailbox = ? AND notification_url = ? ORDER BY expiration DESC",
+            (mailbox.lower(), self.notification_url),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _register(self, sub: dict, mailbox: str):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO subscriptions (id, mailbox, notification_url, expiration) VALUES (?, ?, ?, ?)",
+            (sub["id"], mailbox.lower(), self.notification_url, sub["expirationDateTime"]),
+        )
+        expires = parse_graph_datetime(sub["expirationDateTime"])
+        with self._lock:
+            self.subscription_map[sub["id"]] = mailbox
+            self._expirations[sub["id"]] = expires
+            self._errors.pop(sub["id"], None)
+            heapq.heappush(self._expiry_heap, (expires, sub["id"]))
+
+    def _forget(self, subscription_id: str):
+        self._conn().execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
+        with self._lock:
+            self.subscription_map.pop(subscription_id, None)
+            self._expirations.pop(subscription_id, None)
+            self._errors.pop(subscription_id, None)
+            # Its heap entry is skipped lazily in renew_due
+
+    def _reuse(self, subscription_id: str) -> dict | None:
+        """
+        Return the live subscription if it can be kept, renewing it first
+        when it is close to expiring.
+        """
+        sub = self.graph.get_subscription(subscription_id)
+        if not sub:
+            return None
+        expires_in = parse_graph_datetime(sub["expirationDateTime"]) - _now()
+        if expires_in.total_seconds() > SUBSCRIPTION_RENEW_BEFORE:
+            return sub
+        return self.graph.renew_subscription(subscription_id)
+
+    def ensure_subscription(self, mailbox: str) -> str | None:
+        """
+        Make sure the mailbox has exactly one live subscription.
+        Returns its ID, or None if one could not be created.
+        """
+        kept = None
+        for sub_id in self._persisted_ids(mailbox):
+            if kept:
+                # Only one subscription per mailbox; drop any leftovers
+                self.graph.unsubscribe(sub_id)
+                self._forget(sub_id)
+                continue
+            sub = self._reuse(sub_id)
+            if sub:
+                kept = sub
+                self._register(sub, mailbox)
+                logger.info("Reusing subscription %s for %s", sub_id, mailbox)
+            else:
+                self._forget(sub_id)
+        if kept:
+            return kept["id"]
+
+        sub = self.graph.subscribe_to_mail(self.notification_url, mailbox, self.lifecycle_notification_url)
+        if sub and "id" in sub:
+            self._register(sub, mailbox)
+            return sub["id"]
+        return None
+
+    def remove(self, mailbox: str) -> list[str]:
+        """
+        Delete every subscription for the mailbox. Returns the removed IDs.
+        """
+        with self._lock:
+            sub_ids = {sid for sid, email in self.subscription_map.items() if email.lower() == mailbox.lower()}
+        sub_ids.update(self._persisted_ids(mailbox))
+        for sid in sub_ids:
+            self.graph.unsubscribe(sid)
+            self._forget(sid)
+        return sorted(sub_ids)
+
+    def _renew(self, subscription_id: str):
+        mailbox = self.subscription_map.get(subscription_id)
+        if not mailbox:
+            return
+        sub = self.graph.renew_subscription(subscription_id)
+        if sub:
+            self._register(sub, mailbox)
+            return
+
+        if self.graph.get_subscription(subscription_id) is None:
+            # Graph already dropped it, so renewing can't work: start over
+            logger.warning("Subscription %s for %s is gone, re-subscribing", subscription_id, mailbox)
+            self._forget(subscription_id)
+            if self.ensure_subscription(mailbox) is None:
+                logger.error("Failed to re-subscribe %s", mailbox)
+            return
+
+        with self._lock:
+            self._errors[subscription_id] = "renewal failed"
+
+    def renew_due(self):
+        """
+        Renew every subscription that expires within SUBSCRIPTION_RENEW_BEFORE.
+        Failed renewals stay in the heap and are retried on the next run.
+        """
+        horizon = _now() + datetime.timedelta(seconds=SUBSCRIPTION_RENEW_BEFORE)
+        due = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= horizon:
+                expires, sub_id = heapq.heappop(self._expiry_heap)
+                # Skip entries superseded by a renewal or for forgotten subscriptions
+                if self._expirations.get(sub_id) == expires:
+                    due.append((expires, sub_id))
+
+        for expires, sub_id in due:
+            try:
+                self._renew(sub_id)
+            except Exception as e:
+                logger.error("Error renewing subscription %s: %s", sub_id, e)
+                with self._lock:
+                    self._errors[sub_id] = str(e)
+            with self._lock:
+                if self._expirations.get(sub_id) == expires:
+                    heapq.heappush(self._expiry_heap, (expires, sub_id))
+
+    def handle_lifecycle_event(self, subscription_id: str, event: str):
+        """
+        React to a Graph lifecycle notification for one of our subscriptions.
+        """
+        mailbox = self.subscription_map.get(subscription_id)
+        if not mailbox:
+            logger.warning("Lifecycle event %s for unknown subscription %s", event, subscription_id)
+            return
+
+        logger.info("Lifecycle event %s for %s (%s)", event, mailbox, subscription_id)
+        if event == "reauthorizationRequired":
+            self._renew(subscription_id)
+        elif event == "subscriptionRemoved":
+            self._forget(subscription_id)
+            if self.ensure_subscription(mailbox) is None:
+                logger.error("Failed to re-subscribe %s", mailbox)
+
+    def health(self) -> list[dict]:
+        now = _now()
+        with self._lock:
+            report = []
+            for sub_id, mailbox in sorted(self.subscription_map.items(), key=lambda item: item[1]):
+                expires = self._expirations.get(sub_id)
+                remaining = (expires - now).total_seconds() if expires else None
+                if remaining is None or remaining <= 0:
+                    status = "expired"
+                elif sub_id in self._errors:
+                    status = "renewal_failing"
+                elif remaining <= SUBSCRIPTION_RENEW_BEFORE:
+                    status = "renewal_due"
+                else:
+                    status = "ok"
+                report.append({
+                    "subscription_id": sub_id,
+                    "mailbox": mailbox,
+                    "expiration": expires.isoformat() if expires else None,
+                    "seconds_remaining": int(remaining) if remaining is not None else None,
+                    "status": status,
+                    "last_error": self._errors.get(sub_id),
+                })
+            return report
@@ -1,10 +1,13 @@
-import binascii
 import csv
 import logging
-from io import BytesIO, StringIO
+import threading
+import time
+from io import BufferedReader, BytesIO, StringIO
 from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import SUPABASE_URL, SUPABASE_KEY, MASTER_LIST_VERSION_CHECK_INTERVAL, FILE_FETCH_PAGE_SIZE
 from storage3.exceptions import StorageApiError
+from file_codec import encode_file_data
+from master_list_index import build_index_bytes, store_index_file
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -33,58 +36,231 @@ def get_user_company_file_ids(user_id: str) -> list[str]:
     )
     return [row["file_id"] for row in (res.data or [])]
 
-def fetch_file_record(file_id: str) -> dict | None:
-    res = (
+# Columns needed to parse a list file
+FILE_RECORD_COLUMNS = "id, file_data"
+
+def _iter_pages(build_query, page_size: int):
+    """
+    Yield every row of an ordered query, fetching page_size rows per request.
+    """
+    start = 0
+    while True:
+        rows = build_query().range(start, start + page_size - 1).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+def fetch_file_records(file_ids, columns: str = FILE_RECORD_COLUMNS, page_size: int = FILE_FETCH_PAGE_SIZE):
+    """
+    Yield the list_files rows for file_ids, page_size files per request,
+    so at most one page of file_data is held at a time.
+    """
+    file_ids = sorted(set(file_ids))
+    for i in range(0, len(file_ids), page_size):
+        chunk = file_ids[i:i + page_size]
+        yield from (
+            supabase
+            .table("list_files")
+            .select(columns)
+            .in_("id", chunk)
+            .execute()
+            .data
+        ) or []
+
+def fetch_files_created_by(user_id: str, columns: str = FILE_RECORD_COLUMNS, page_size: int = FILE_FETCH_PAGE_SIZE):
+    """
+    Yield the list_files rows created by a user, page_size files per request.
+    """
+    return _iter_pages(
+        lambda: supabase.table("list_files").select(columns).eq("created_by", user_id).order("id"),
+        page_size,
+    )
+
+def get_user_emails_for_files(file_ids: list[str]) -> set[str]:
+    """
+    Emails of every user linked to any of the files, in one joined query.
+    """
+    if not file_ids:
+        return set()
+    links = (
         supabase
-        .table("list_files")
-        .select("*")
-        .eq("id", file_id)
-        .single()
+        .table("company_recipient_lists")
+        .select("user_id, users(email)")
+        .in_("file_id", list(file_ids))
         .execute()
-    )
-    return res.data if res.data else None
-
-def decode_file_data_hex(hex_data: str) -> bytes:
-    if hex_data.startswith("\\x") or hex_data.startswith("0x"):
-        hex_str = hex_data[2:]
-    else:
-        hex_str = hex_data
-    return binascii.unhexlify(hex_str)
-
-def upload_master_list(user_email: str, csv_bytes: bytes) -> bool:
-    bucket = "master-lists"
-    path = f"{user_email}/master_list.csv"
+        .data
+    ) or []
+    emails = set()
+    for link in links:
+        users = link.get("users") or []
+        for user in users if isinstance(users, list) else [users]:
+            if user.get("email"):
+                emails.add(user["email"])
+    return emails
+
+MASTER_LIST_BUCKET = "master-lists"
+MASTER_LIST_FILENAME = "master_list.csv"
+MASTER_LIST_INDEX_FILENAME = "master_list.idx"
+
+def upload_master_list(user_email: str, csv_data: bytes | BufferedReader,
+                       email_index: frozenset[str] | None = None) -> bool:
+    """
+    Upload the user's master list CSV, given as bytes or a file opened for
+    binary reading (which is streamed), along with its binary lookup index.
+    Pass `email_index` when the caller already knows the list's normalized
+    addresses, to skip re-parsing it.
+    """
+    bucket = MASTER_LIST_BUCKET
+    path = f"{user_email}/{MASTER_LIST_FILENAME}"
     file_options = {"upsert": "true"}
+    if email_index is None:
+        if isinstance(csv_data, bytes):
+            email_index = build_email_index(csv_data)
+        else:
+            email_index = build_email_index(csv_data.read())
+            csv_data.seek(0)
 
+    # The index goes first: readers key it by the CSV's version, so it must
+    # never be older than the CSV they see
     try:
-        supabase.storage.from_(bucket).upload(path, csv_bytes, file_options)
-        return True
+        supabase.storage.from_(bucket).upload(
+            f"{user_email}/{MASTER_LIST_INDEX_FILENAME}",
+            build_index_bytes(email_index),
+            {"upsert": "true", "content-type": "application/octet-stream"},
+        )
+        supabase.storage.from_(bucket).upload(path, csv_data, file_options)
     except StorageApiError as e:
         logger.error("Failed to upload master list for %s: %s", user_email, e)
         return False
 
+    # We already hold the new contents, so refresh our own index without a download
+    try:
+        version = get_master_list_version(user_email)
+    except Exception as e:
+        logger.warning("Could not read master list version for %s: %s", user_email, e)
+        version = None
+    _set_master_list_index(user_email, email_index, version)
+    return True
+
 def download_master_list(user_email: str) -> bytes | None:
-    bucket = "master-lists"
-    path = f"{user_email}/master_list.csv"
+    bucket = MASTER_LIST_BUCKET
+    path = f"{user_email}/{MASTER_LIST_FILENAME}"
     return supabase.storage.from_(bucket).download(path)
 
-def is_email_in_master_list(user_email: str, sender_email: str) -> bool:
+def download_master_list_index(user_email: str) -> bytes | None:
+    path = f"{user_email}/{MASTER_LIST_INDEX_FILENAME}"
+    try:
+        return supabase.storage.from_(MASTER_LIST_BUCKET).download(path)
+    except StorageApiError as e:
+        logger.info("No binary master list index for %s: %s", user_email, e)
+        return None
+
+def get_master_list_version(user_email: str) -> str | None:
     """
-    Check if the sender_email exists in the user's master_list.
+    Return the storage ETag of the user's master list, or None if it doesn't exist.
+    """
+    files = supabase.storage.from_(MASTER_LIST_BUCKET).list(user_email, {"search": MASTER_LIST_FILENAME})
+    for f in files or []:
+        if f.get("name") == MASTER_LIST_FILENAME:
+            metadata = f.get("metadata") or {}
+            return metadata.get("eTag") or f.get("updated_at") or ""
+    return None
+
+def build_email_index(csv_bytes: bytes) -> frozenset[str]:
+    """
+    Collect the normalized (stripped, lowercase) addresses from every email
+    column of a master list CSV.
+    """
+    reader = csv.reader(StringIO(csv_bytes.decode("utf-8")))
+    header = next(reader, None)
+    if not header:
+        return frozenset()
+
+    email_cols = [i for i, h in enumerate(header) if h.strip().lower() in ("email", "email id")]
+    emails = set()
+    for row in reader:
+        for i in email_cols:
+            if i < len(row) and row[i]:
+                emails.add(row[i].strip().lower())
+                break
+    return frozenset(emails)
+
+# user_email -> {"emails": frozenset | MasterListIndexFile, "version": str | None, "checked_at": float}
+_master_list_indexes: dict[str, dict] = {}
+_master_list_locks: dict[str, threading.Lock] = {}
+_master_list_locks_guard = threading.Lock()
+
+def _set_master_list_index(user_email: str, emails, version: str | None):
+    _master_list_indexes[user_email.lower()] = {
+        "emails": emails,
+        "version": version,
+        "checked_at": time.monotonic(),
+    }
+
+def _load_master_list_index(user_email: str):
+    """
+    Map the user's binary index artifact, falling back to downloading and
+    parsing the CSV when the artifact is missing or unreadable.
     """
+    index_bytes = download_master_list_index(user_email)
+    if index_bytes:
+        try:
+            emails = store_index_file(user_email, index_bytes)
+            logger.info("Mapped master list index for %s (%d emails)", user_email, len(emails))
+            return emails
+        except Exception as e:
+            logger.warning("Ignoring unusable master list index for %s: %s", user_email, e)
+
     file_bytes = download_master_list(user_email)
-    if not file_bytes:
-        return False
+    emails = build_email_index(file_bytes) if file_bytes else frozenset()
+    logger.info("Built master list index for %s (%d emails)", user_email, len(emails))
+    return emails
+
+def _get_master_list_index(user_email: str):
+    """
+    Return the user's email index (anything supporting `in` on a normalized
+    address), re-validating its storage version at most once per
+    MASTER_LIST_VERSION_CHECK_INTERVAL and reloading it only when another
+    process has uploaded a new master list.
+    """
+    key = user_email.lower()
+    index = _master_list_indexes.get(key)
+    if index and time.monotonic() - index["checked_at"] < MASTER_LIST_VERSION_CHECK_INTERVAL:
+        return index["emails"]
+
+    with _master_list_locks_guard:
+        lock = _master_list_locks.setdefault(key, threading.Lock())
+    with lock:
+        index = _master_list_indexes.get(key)
+        if index and time.monotonic() - index["checked_at"] < MASTER_LIST_VERSION_CHECK_INTERVAL:
+            return index["emails"]
+
+        try:
+            version = get_master_list_version(user_email)
+        except Exception as e:
+            if index:
+                logger.warning("Could not check master list version for %s, using cached index: %s", user_email, e)
+                index["checked_at"] = time.monotonic()
+                return index["emails"]
+            raise
 
-    csv_text = file_bytes.decode("utf-8")
-    csv_reader = csv.DictReader(StringIO(csv_text))
+        if index and index["version"] == version:
+            index["checked_at"] = time.monotonic()
+            return index["emails"]
 
-    for row in csv_reader:
-        email = row.get("email") or row.get("Email") or row.get("EMAIL") or row.get('Email ID') or row.get('email id')
-        if email and email.strip().lower() == sender_email.lower():
-            return True
+        emails = frozenset() if version is None else _load_master_list_index(user_email)
 
-    return False
+        _set_master_list_index(user_email, emails, version)
+        return emails
+
+def is_email_in_master_list(user_email: str, sender_email: str) -> bool:
+    """
+    Check if the sender_email exists in the user's master_list.
+    """
+    if not sender_email:
+        return False
+    return sender_email.strip().lower() in _get_master_list_index(user_email)
 
 def store_contact_change(old_email: str, new_email: str, new_name: str):
     supabase.table("contact_changes").insert({
@@ -98,25 +274,25 @@ def store_unsubscribe_email(email: str):
 
 def update_file_data(file_id: str, rows: list[dict], fieldnames: list[str]):
     """
-    Updates the list_files table with new CSV data encoded in hex, prefixed with \\x.
+    Updates the list_files table with new CSV data, compressed by file_codec.
     """
     output = StringIO()
     writer = csv.DictWriter(output, fieldnames=fieldnames)
     writer.writeheader()
     writer.writerows(rows)
-    csv_string = output.getvalue()
-    hex_string = "\\x" + csv_string.encode("utf-8").hex()
+    file_data = encode_file_data(output.getvalue().encode("utf-8"))
 
-    supabase.table("list_files").update({"file_data": hex_string}).eq("id", file_id).execute()
+    supabase.table("list_files").update({"file_data": file_data}).eq("id", file_id).execute()
 
 def delete_master_list(user_email: str) -> bool:
     """
-    Deletes the master list CSV from Supabase Storage if it exists.
+    Deletes the master list CSV and its index from Supabase Storage if they exist.
     Returns True if successful or not found, False on error.
     """
     try:
-        path = f"{user_email}/master_list.csv"
-        deleted_files = supabase.storage.from_("master-lists").remove([path])
+        paths = [f"{user_email}/{MASTER_LIST_FILENAME}", f"{user_email}/{MASTER_LIST_INDEX_FILENAME}"]
+        deleted_files = supabase.storage.from_(MASTER_LIST_BUCKET).remove(paths)
+        _set_master_list_index(user_email, frozenset(), None)
         if not deleted_files:
             logger.info("Master list file not found or already deleted for %s", user_email)
         else:
@@ -0,0 +1,44 @@
+import csv
+import io
+import pytest
+from file_codec import (
+    FileDataCodecError,
+    decode_file_data,
+    encode_file_data,
+    is_legacy_file_data,
+    open_file_data,
+)
+
+DATA = ("email,name\n" + "".join(f"user{i}@example.com,User {i}\n" for i in range(5000))).encode("utf-8")
+
+@pytest.mark.parametrize("value", [
+    "\\x" + DATA.hex(),
+    "0x" + DATA.hex(),
+    DATA.hex(),
+    encode_file_data(DATA),
+    # Framed value read back from a bytea column
+    "\\x" + encode_file_data(DATA).encode("ascii").hex(),
+])
+def test_decodes_every_stored_format(value):
+    assert decode_file_data(value) == DATA
+
+def test_only_hex_of_raw_bytes_is_legacy():
+    assert is_legacy_file_data("\\x" + DATA.hex())
+    assert is_legacy_file_data(DATA.hex())
+    assert not is_legacy_file_data(encode_file_data(DATA))
+    assert not is_legacy_file_data("\\x" + encode_file_data(DATA).encode("ascii").hex())
+    assert not is_legacy_file_data("\\x" + encode_file_data(DATA).encode("ascii").hex().upper())
+
+def test_encoded_is_smaller_than_hex():
+    assert len(encode_file_data(DATA)) < len("\\x" + DATA.hex()) / 2
+
+def test_stream_parses_as_csv():
+    reader = csv.DictReader(io.TextIOWrapper(open_file_data(encode_file_data(DATA)), encoding="utf-8", newline=""))
+    rows = list(reader)
+    assert len(rows) == 5000
+    assert rows[-1] == {"email": "user4999@example.com", "name": "User 4999"}
+
+@pytest.mark.parametrize("value", [encode_file_data(DATA)[:-40], "\\xzz"])
+def test_corrupt_values_raise(value):
+    with pytest.raises(FileDataCodecError):
+        decode_file_data(value)
@@ -0,0 +1,60 @@
+import threading
+import pytest
+from notification_queue import NotificationQueue, NotificationQueueFull
+
+def test_mailboxes_run_in_parallel_and_in_order():
+    mailboxes = ["conference@example.com", "kdanisavage@example.com", "a@example.com", "b@example.com"]
+    # The first job of every mailbox waits here until all four are running at once
+    first_jobs = threading.Barrier(len(mailboxes), timeout=5)
+    lock = threading.Lock()
+    running, overlaps, seen, broken = set(), [], [], []
+    peak = 0
+
+    def handler(mailbox, i):
+        nonlocal peak
+        with lock:
+            if mailbox in running:
+                overlaps.append(mailbox)
+            running.add(mailbox)
+            peak = max(peak, len(running))
+        if i == 0:
+            try:
+                first_jobs.wait()
+            except threading.BrokenBarrierError:
+                broken.append(mailbox)
+        with lock:
+            running.discard(mailbox)
+            seen.append((mailbox, i))
+
+    q = NotificationQueue(handler, workers=4, max_size=100)
+    q.start()
+    for i in range(10):
+        for mailbox in mailboxes:
+            q.put(mailbox, mailbox, i)
+    assert q.shutdown(10)
+
+    assert not broken
+    assert peak == len(mailboxes)
+    assert not overlaps
+    for mailbox in mailboxes:
+        assert [i for m, i in seen if m == mailbox] == list(range(10))
+
+def test_put_raises_when_full_or_stopped():
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(*args):
+        started.set()
+        release.wait()
+
+    q = NotificationQueue(handler, workers=1, max_size=1)
+    q.start()
+    q.put("a@example.com", 1)
+    assert started.wait(5)
+    q.put("a@example.com", 2)
+    with pytest.raises(NotificationQueueFull):
+        q.put("b@example.com", 1)
+    release.set()
+    assert q.shutdown(5)
+    with pytest.raises(NotificationQueueFull):
+        q.put("a@example.com", 3)
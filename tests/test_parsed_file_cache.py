@@ -0,0 +1,33 @@
+import threading
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+from parsed_file_cache import ParsedFileCache
+
+def test_concurrent_puts_for_one_file(tmp_path):
+    cache = ParsedFileCache(str(tmp_path))
+    df = pd.DataFrame({"email": [f"user{i}@example.com" for i in range(2000)], "name": ["x"] * 2000})
+    cache.put("file-1", "old", df)
+
+    start = threading.Barrier(24)
+    errors = []
+
+    def put():
+        start.wait()
+        try:
+            cache.put("file-1", "new", df)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(24)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["file-1-new.csv.gz"]
+    assert cache.get("file-1", "new").equals(df)
+    assert cache.get("file-1", "old") is None
@@ -0,0 +1,58 @@
+import pytest
+from rule_classifier import classify_by_rules
+
+def category(text, exclude=None):
+    result = classify_by_rules(text, exclude)
+    return result["category"] if result else None
+
+@pytest.mark.parametrize("text", [
+    "I left you a voicemail this morning. My assistant Jane Doe at jane@acme.com can set up a time.",
+    "I left you a voicemail this morning. Jane Doe at jane@acme.com handles my calendar.",
+    "I will pass this along to my partner.",
+    "No thanks needed! Happy to chat next week",
+    "Thanks for reaching out. No thanks needed.",
+    "We're not interested in the fund at this time, but would love to hear about co-invest. Give me a call.",
+    "Not interested in the fund. However, we do co-invest.",
+    "Not a fit right now. Let's meet in the spring.",
+    "Please do not unsubscribe me, I still want to receive these updates.",
+    "Please don't remove me from the distribution list.",
+    "Please stop sending the paper copies; email is fine.",
+    "No, thanks for following up. We already wired the funds and are excited to be in.",
+])
+def test_ambiguous_replies_go_to_the_llm(text):
+    assert classify_by_rules(text, ["sender@acme.com"]) is None
+
+@pytest.mark.parametrize("text, expected", [
+    ("Please unsubscribe me from this list.", "Unsubscribe"),
+    ("Not interested, please remove me.", "Unsubscribe"),
+    ("No thanks.", "Not Interested"),
+    ("No thanks", "Not Interested"),
+    ("Please stop emailing me.", "Unsubscribe"),
+    ("Please stop sending me these emails.", "Unsubscribe"),
+    ("Do not email me again.", "Unsubscribe"),
+    ("No, thank you. We are not looking at new managers.", "Not Interested"),
+    ("We will pass.", "Not Interested"),
+    ("We'll pass on this one.", "Not Interested"),
+    ("We are not interested at this time.", "Not Interested"),
+])
+def test_unambiguous_replies(text, expected):
+    assert category(text) == expected
+
+def test_contact_changed_needs_departure_and_new_contact():
+    result = classify_by_rules(
+        "John has left the firm. Please contact Jane Doe at jane@acme.com going forward.",
+        ["john@acme.com"],
+    )
+    assert result["category"] == "Contact Changed"
+    assert result["new_contact_name"] == "Jane Doe"
+    assert result["new_contact_email"] == "jane@acme.com"
+
+    # No replacement named
+    assert classify_by_rules("I am no longer with Acme.", ["john@acme.com"]) is None
+
+def test_new_contact_skips_excluded_addresses():
+    result = classify_by_rules(
+        "I am no longer with Acme. Reach out to Mark Lee (mark@acme.com) instead of john@acme.com.",
+        ["john@acme.com"],
+    )
+    assert result["new_contact_email"] == "mark@acme.com"
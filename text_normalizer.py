@@ -0,0 +1,139 @@
+import html
+import re
+from config import EMAIL_BODY_TOKEN_BUDGET
+
+# Rough size of a gpt-4o-mini token in English text
+CHARS_PER_TOKEN = 4
+
+BANNED_PHRASES = [
+    "You don't often get email from",
+    "Learn why this is important",
+]
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_INVISIBLE_RE = re.compile(r"<(script|style|head|title)\b[^>]*>.*?</\1\s*>", re.I | re.S)
+_BLOCK_TAG_RE = re.compile(
+    r"<\s*/?\s*(?:br|p|div|li|tr|h[1-6]|blockquote|table|hr|ul|ol|pre)\b[^>]*>", re.I
+)
+_TAG_RE = re.compile(r"<[^>]*>")
+_INLINE_SPACE_RE = re.compile(r"[ \t\r\f\v\u00a0\u200b]+")
+_BANNED_RE = re.compile("|".join(re.escape(p) for p in BANNED_PHRASES))
+
+# Start of a quoted reply or forwarded message
+_QUOTE_START_RE = re.compile(
+    r"^(?:"
+    r"On\b[^\n]{0,250}(?:\n[^\n]{0,250})?\bwrote:"
+    r"|-{2,}\s*(?:Original|Forwarded) Message\s*-{2,}"
+    r"|_{10,}"
+    r"|From:[^\n]*\n(?:Sent|Date):"
+    r"|>"
+    r")",
+    re.I | re.M,
+)
+
+# Start of a signature block or legal footer
+_SIGNATURE_START_RE = re.compile(
+    r"^(?:"
+    r"--\s*$"
+    r"|Sent from my \w+"
+    r"|Get Outlook for \w+"
+    r"|(?:CONFIDENTIALITY|PRIVILEGED)[ A-Z]*NOTICE"
+    r"|DISCLAIMER\b"
+    r"|This (?:e-?mail|message|communication)(?: and any (?:attachments|files)[^\n]{0,40})? (?:is|are|may (?:be|contain)|contains?) (?:confidential|privileged|intended)"
+    r")",
+    re.I | re.M,
+)
+
+def html_to_text(html_body: str) -> str:
+    """
+    Convert HTML to text with a handful of C-level regex passes instead of
+    building a parse tree. Block-level tags become line breaks.
+    """
+    text = _COMMENT_RE.sub("", html_body)
+    text = _INVISIBLE_RE.sub("", text)
+    text = _BLOCK_TAG_RE.sub("\n", text)
+    text = _TAG_RE.sub("", text)
+    return html.unescape(text)
+
+def clean_lines(text: str) -> str:
+    """
+    Collapse whitespace, drop blank lines and Outlook's external-sender banners.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = _INLINE_SPACE_RE.sub(" ", line).strip()
+        if line and not _BANNED_RE.search(line):
+            lines.append(line)
+    return "\n".join(lines)
+
+def strip_quoted_and_signature(text: str) -> str:
+    """
+    Keep only what the sender wrote: cut at the first quoted-reply header,
+    then at the first signature or legal footer.
+    If that would leave nothing (e.g. a bare forward), the text is returned as is.
+    """
+    stripped = text
+    match = _QUOTE_START_RE.search(stripped)
+    if match:
+        stripped = stripped[:match.start()]
+    match = _SIGNATURE_START_RE.search(stripped)
+    if match:
+        stripped = stripped[:match.start()]
+    stripped = stripped.strip()
+    return stripped or text
+
+def truncate_to_token_budget(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if max_tokens <= 0 or len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+def message_text(content: str, content_type: str | None = "text") -> str:
+    """
+    Full cleaned text of a message body, including any quoted thread.
+    """
+    if (content_type or "").lower() == "html":
+        content = html_to_text(content)
+    return clean_lines(content)
+
+def normalize_email_body(content: str, content_type: str | None = "text",
+                         max_tokens: int = EMAIL_BODY_TOKEN_BUDGET) -> str:
+    """
+    Text to send to the classifier: cleaned, without the quoted thread,
+    signature or footer, and capped at roughly `max_tokens` tokens.
+    """
+    text = strip_quoted_and_signature(message_text(content, content_type))
+    return truncate_to_token_budget(text, max_tokens)
+
+if __name__ == "__main__":
+    # Benchmark against a directory of saved reply bodies (*.html / *.txt):
+    #   python text_normalizer.py path/to/corpus
+    import os
+    import sys
+    import time
+    from bs4 import BeautifulSoup  # type: ignore
+
+    def legacy_extract(html_body: str) -> str:
+        soup = BeautifulSoup(html_body, "html.parser")
+        text = soup.get_text(separator="\n")
+        lines = [line.strip() for line in text.splitlines() if not any(b in line for b in BANNED_PHRASES)]
+        return "\n".join(filter(None, lines)).strip()
+
+    corpus_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    bodies = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith((".html", ".htm", ".txt")):
+            with open(os.path.join(corpus_dir, name), encoding="utf-8", errors="replace") as f:
+                bodies.append(f.read())
+    if not bodies:
+        sys.exit(f"No .html/.txt files found in {corpus_dir}")
+
+    for label, fn in (("bs4 extract_actual_body", legacy_extract),
+                      ("normalize_email_body", lambda b: normalize_email_body(b, "html"))):
+        start = time.perf_counter()
+        outputs = [fn(b) for b in bodies]
+        elapsed = time.perf_counter() - start
+        chars = sum(len(o) for o in outputs)
+        print(f"{label:<26} {elapsed / len(bodies) * 1000:8.3f} ms/email  "
+              f"{chars / len(bodies):9.0f} chars/email  ~{chars / len(bodies) / CHARS_PER_TOKEN:7.0f} tokens/email")
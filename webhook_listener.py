@@ -1,7 +1,9 @@
 import logging
+import threading
 from flask import Flask, request, jsonify, current_app
-from email_processor import process_email_notification
-from recipient_list_loader import compile_and_store_master_list
+from email_processor import process_email_notification, DESTINATION_FOLDERS
+from notification_queue import NotificationQueueFull
+from recompile_scheduler import master_list_recompiler
 from supabase_client import supabase
 
 app = Flask(__name__)
@@ -19,6 +21,8 @@ def notification():
     if not data or "value" not in data:
         return jsonify({"error": "Invalid payload"}), 400
 
+    notification_queue = current_app.config.get("NOTIFICATION_QUEUE")
+
     for item in data.get("value", []):
         sub_id = item.get("subscriptionId")
         user_email = current_app.config["SUBSCRIPTION_MAP"].get(sub_id)
@@ -34,11 +38,57 @@ def notification():
         resource = f"users/{user_email}/mailFolders('Inbox')/messages/{message_id}"
         logger.info("New email for %s", user_email)
 
-        process_email_notification(resource, user_email)
+        if notification_queue is None:
+            process_email_notification(resource, user_email)
+            continue
+
+        try:
+            notification_queue.put(user_email, resource, user_email)
+        except NotificationQueueFull as e:
+            # Ask Graph to redeliver later; anything already queued is deduplicated
+            logger.warning("Rejecting notification batch: %s", e)
+            return jsonify({"error": "Busy"}), 503, {"Retry-After": "30"}
 
     return jsonify({"status": "received"}), 202
 
 
+@app.route("/lifecycle", methods=["POST", "GET"])
+def lifecycle():
+    # Same validation handshake as /notification
+    validation_token = request.args.get("validationToken")
+    if validation_token:
+        return validation_token, 200, {"Content-Type": "text/plain"}
+
+    data = request.get_json(silent=True)
+    if not data or "value" not in data:
+        return jsonify({"error": "Invalid payload"}), 400
+
+    subscriptions = current_app.config.get("SUBSCRIPTION_MANAGER")
+    delta_sync = current_app.config.get("DELTA_SYNC")
+    for item in data.get("value", []):
+        sub_id = item.get("subscriptionId")
+        event = item.get("lifecycleEvent")
+        try:
+            subscriptions.handle_lifecycle_event(sub_id, event)
+        except Exception as e:
+            logger.error("Error handling lifecycle event %s: %s", event, e)
+
+        # Graph dropped some notifications: catch up from the delta link
+        mailbox = subscriptions.subscription_map.get(sub_id)
+        if event == "missed" and mailbox and delta_sync:
+            threading.Thread(target=delta_sync.sync_mailbox, args=(mailbox,), daemon=True).start()
+
+    return jsonify({"status": "received"}), 202
+
+
+@app.route("/subscriptions/health", methods=["GET"])
+def subscriptions_health():
+    subscriptions = current_app.config.get("SUBSCRIPTION_MANAGER")
+    report = subscriptions.health()
+    healthy = all(sub["status"] in ("ok", "renewal_due") for sub in report)
+    return jsonify({"healthy": healthy, "subscriptions": report}), 200 if healthy else 503
+
+
 @app.route("/user_toggle", methods=["POST"])
 def user_toggle():
     data = request.get_json(silent=True)
@@ -56,21 +106,19 @@ def user_toggle():
         return jsonify({"error": "Missing email or status"}), 400
 
     graph = current_app.config.get("GRAPH_CLIENT")
-    subscription_map = current_app.config.get("SUBSCRIPTION_MAP", {})
+    subscriptions = current_app.config.get("SUBSCRIPTION_MANAGER")
 
     if new_status:
-        sub = graph.subscribe_to_mail(f"{current_app.config['PUBLIC_URL']}/notification", user_email)
-        if sub and "id" in sub:
-            subscription_map[sub["id"]] = user_email
-            logger.info("Enabled inbox monitoring for %s with subscription %s", user_email, sub["id"])
+        sub_id = subscriptions.ensure_subscription(user_email)
+        if sub_id:
+            logger.info("Enabled inbox monitoring for %s with subscription %s", user_email, sub_id)
+            graph.warm_folder_cache(user_email, DESTINATION_FOLDERS)
         else:
             logger.error("Failed to subscribe %s", user_email)
     else:
-        sub_ids_to_remove = [sid for sid, email in subscription_map.items() if email == user_email]
-        for sid in sub_ids_to_remove:
-            graph.unsubscribe(sid)
-            del subscription_map[sid]
+        for sid in subscriptions.remove(user_email):
             logger.info("Disabled inbox monitoring for %s by removing subscription %s", user_email, sid)
+        graph.folder_cache.invalidate(user_email)
 
     return jsonify({"status": "updated"}), 200
 
@@ -101,11 +149,9 @@ def company_list_update():
     )
     if user_res.data:
         user_email = user_res.data["email"]
-        try:
-            compile_and_store_master_list(user_email)
-            logger.info("Updated master list for %s", user_email)
-        except Exception as e:
-            logger.error("Error compiling list for %s: %s", user_email, e)
+        # Rebuilt shortly, together with any other updates for this user
+        master_list_recompiler.schedule(user_email)
+        logger.info("Scheduled master list update for %s", user_email)
     else:
         logger.warning("No email found for user ID: %s", user_id)
 